@@ -0,0 +1,169 @@
+import copy
+import os
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+
+class TokenCache:
+    """Ограниченный по размеру и времени жизни LRU-кеш token -> user.
+
+    Кеш свой у каждого процесса. Отзыв токена видят все процессы
+    через метку в общем кеше Django, см. CachedTokenAuthentication.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation):
+        """Сохраняет значение, если с начала его чтения из базы
+        кеш не сбрасывался.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys=None, user_id=None):
+        """Удаляет токены keys и все токены пользователя user_id."""
+        with self._lock:
+            self._generation += 1
+            for key in keys or ():
+                self._entries.pop(key, None)
+            if user_id is not None:
+                for key in [
+                    key for key, (_, (user, *_)) in self._entries.items()
+                    if user.pk == user_id
+                ]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def marker_key(key):
+    return f'auth:token:{key}'
+
+
+def get_marker(key):
+    """Текущая метка токена в общем кеше; создается при отсутствии."""
+    marker = cache.get(marker_key(key))
+    if marker is None:
+        cache.add(marker_key(key), uuid4().hex, None)
+        marker = cache.get(marker_key(key))
+    return marker
+
+
+def revoke_tokens(keys):
+    """Меняет метки токенов после фиксации транзакции, так что
+    записи о них в кешах всех процессов становятся недействительными.
+    """
+    keys = list(keys)
+    token_cache.invalidate(keys=keys)
+    transaction.on_commit(lambda: cache.set_many(
+        {marker_key(key): uuid4().hex for key in keys}, None
+    ))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем token -> user в памяти процесса.
+
+    Запись кеша действительна, пока метка токена в общем кеше Django
+    совпадает с меткой, прочитанной до загрузки токена из базы.
+    При выходе, удалении токена, смене пароля или деактивации метка
+    меняется, и токен перестает приниматься во всех процессах
+    со следующего запроса. Метку видят все процессы только при общем
+    CACHE_BACKEND, поэтому без TOKEN_CACHE_ENABLED (по умолчанию он
+    выключен для LocMemCache) токен каждый раз читается из базы.
+    Каждый запрос получает свою копию пользователя,
+    поэтому изменения request.user во view не попадают в кеш.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_ENABLED:
+            return super().authenticate_credentials(key)
+        marker = get_marker(key)
+        cached = token_cache.get(key)
+        if cached is None or cached[2] != marker:
+            generation = token_cache.generation
+            cached = (*super().authenticate_credentials(key), marker)
+            token_cache.set(key, cached, generation)
+        user, token, _ = cached
+        return copy.copy(user), token
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Отзывает токен при выходе через djoser и удалении токена."""
+    revoke_tokens((instance.key,))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, update_fields=None, **kwargs):
+    """Отзывает токены пользователя при его сохранении: смене пароля,
+    деактивации или изменении профиля. Сохранение last_login при
+    входе токены не отзывает.
+    """
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    token_cache.invalidate(user_id=instance.pk)
+    revoke_tokens(
+        Token.objects.filter(user_id=instance.pk).values_list(
+            'key', flat=True
+        )
+    )
@@ -1,4 +1,6 @@
+from django import forms
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import OrderingFilter
 
 from recipes.models import Ingredient, Recipe, Tag
 
@@ -13,8 +15,16 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
 
+class IdInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список целых id через запятую."""
+
+    field_class = forms.IntegerField
+
+
 class RecipeFilter(FilterSet):
-    """Фильтр по тегам, избранному и корзине."""
+    """Фильтр по тегам, избранному, корзине, поисковому запросу
+    и имеющимся или исключенным ингредиентам.
+    """
 
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -25,6 +35,9 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
+    ingredients = IdInFilter(method='ingredients_filter')
+    exclude_ingredients = IdInFilter(method='exclude_ingredients_filter')
 
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
@@ -38,6 +51,41 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=user)
         return queryset
 
+    def search_filter(self, queryset, name, value):
+        return queryset.search(value)
+
+    def ingredients_filter(self, queryset, name, value):
+        return queryset.with_ingredients(value)
+
+    def exclude_ingredients_filter(self, queryset, name, value):
+        return queryset.without_ingredients(value)
+
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'exclude_ingredients',
+        )
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов.
+
+    Если порядок не задан явно, при поиске рецепты идут по релевантности,
+    а при подборе по ингредиентам - по числу совпавших ингредиентов.
+    """
+
+    rank_fields = (
+        ('search', '-search_rank'),
+        ('ingredients', '-ingredients_coverage'),
+    )
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if request.query_params.get(self.ordering_param):
+            return ordering
+        ranks = tuple(
+            field for param, field in self.rank_fields
+            if request.query_params.get(param)
+        )
+        return (*ranks, *ordering)
@@ -0,0 +1,138 @@
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import reference
+from api.representations import (ingredient_list, recipe_list,
+                                 subscription_list, tag_list)
+from api.serializers import (IngredientSerializer, RecipeSerializer,
+                             TagSerializer)
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+REPEAT: int = 20
+LIMIT: int = 100
+RECIPES_LIMIT: int = 3
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время построения ответов списков эталонными '
+        'сериализаторами DRF (api.reference) и быстрыми представлениями '
+        'api.representations на одних и тех же объектах.'
+    )
+
+    def get_user(self, email):
+        users = User.objects.filter(is_active=True)
+        if email:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(follower__isnull=False).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError('No suitable user found.')
+        return user
+
+    def get_request(self, user, query=None):
+        request = Request(APIRequestFactory().get('/api/', query))
+        request.user = user
+        return request
+
+    def get_cases(self, user, limit):
+        """Пары (эталон, быстрый путь) функций без аргументов. Запрос
+        и QuerySet создаются при каждом вызове, чтобы ни один вариант
+        не пользовался загруженными в прошлом вызове данными.
+        """
+        recipes = list(
+            Recipe.objects.select_related('author').order_by(
+                '-pub_date', 'id'
+            )[:limit]
+        )
+        if not recipes:
+            raise CommandError('No recipes, run seed_data first.')
+        authors = list(
+            User.objects.filter(following__user=user).order_by(
+                'following__id'
+            )[:limit]
+        )
+
+        def context(query=None):
+            return {'request': self.get_request(user, query)}
+
+        return {
+            'recipes': (
+                lambda: reference.RecipeSerializer(
+                    recipes, many=True, context=context()
+                ).data,
+                lambda: recipe_list(recipes, context()['request']),
+            ),
+            'recipes_cached': (
+                lambda: reference.RecipeSerializer(
+                    recipes, many=True, context=context()
+                ).data,
+                lambda: RecipeSerializer(
+                    recipes, many=True, context=context()
+                ).data,
+            ),
+            'subscriptions': (
+                lambda: reference.SubscriptionSerializer(
+                    authors, many=True,
+                    context=context({'recipes_limit': RECIPES_LIMIT}),
+                ).data,
+                lambda: subscription_list(authors, RECIPES_LIMIT),
+            ),
+            'tags': (
+                lambda: TagSerializer(Tag.objects.all(), many=True).data,
+                lambda: tag_list(Tag.objects.all()),
+            ),
+            'ingredients': (
+                lambda: IngredientSerializer(
+                    Ingredient.objects.all()[:limit], many=True
+                ).data,
+                lambda: ingredient_list(Ingredient.objects.all()[:limit]),
+            ),
+        }
+
+    def measure(self, build, repeat):
+        build()
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = perf_counter()
+                build()
+                timings.append((perf_counter() - started) * 1000)
+        return median(timings), len(queries)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=REPEAT,
+            help='Число замеров каждого варианта.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=LIMIT,
+            help='Число объектов в списке.',
+        )
+        parser.add_argument(
+            '--user', help='Почта пользователя, от имени которого '
+                           'строятся ответы.',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['limit'] < 1:
+            raise CommandError('--repeat and --limit must be positive.')
+        user = self.get_user(options['user'])
+        for name, (slow, fast) in self.get_cases(
+            user, options['limit']
+        ).items():
+            slow_ms, slow_queries = self.measure(slow, options['repeat'])
+            fast_ms, fast_queries = self.measure(fast, options['repeat'])
+            self.stdout.write(
+                f'{name:<16} drf {slow_ms:>8.2f} ms {slow_queries:>4} q  '
+                f'fast {fast_ms:>8.2f} ms {fast_queries:>4} q  '
+                f'x{slow_ms / fast_ms:.1f}'
+            )
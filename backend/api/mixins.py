@@ -0,0 +1,175 @@
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import ModelVersion, user_state_label
+
+CACHE_FRESH_SECONDS: int = 60
+CACHE_STALE_SECONDS: int = 300
+CACHE_LOCK_SECONDS: int = 10
+CACHE_WAIT_SECONDS: float = 2.0
+CACHE_POLL_SECONDS: float = 0.05
+
+
+class ModelVersionsMixin:
+    """Mixin, читающий версии моделей не больше одного раза за запрос.
+
+    Вместо модели можно передать готовую метку версии.
+    """
+
+    def get_model_versions(self, models):
+        labels = [
+            model if isinstance(model, str) else model._meta.label_lower
+            for model in models
+        ]
+        versions = self.__dict__.setdefault('_model_versions', {})
+        missing = [label for label in labels if label not in versions]
+        if missing:
+            versions.update(ModelVersion.get_many(*missing))
+        return {label: versions[label] for label in labels}
+
+
+class ConditionalGetMixin(ModelVersionsMixin):
+    """Mixin для условных GET-запросов (ETag, Last-Modified, 304).
+
+    Валидаторы строятся из версий моделей в conditional_models, поэтому
+    совпавший If-None-Match обрабатывается до выполнения queryset
+    и сериализации. Валидаторы выставляются только для действий
+    из conditional_actions; для действий из user_dependent_actions
+    в ETag добавляются id пользователя и версия его избранного,
+    корзины и подписок, поэтому чужие изменения его ETag не меняют.
+    """
+
+    conditional_models = ()
+    conditional_actions = ('list', 'retrieve')
+    user_dependent_actions = ()
+
+    def get_validators(self, request):
+        labels = list(self.conditional_models)
+        if (
+            self.action in self.user_dependent_actions
+            and request.user.is_authenticated
+        ):
+            labels.append(user_state_label(request.user.pk))
+        versions = self.get_model_versions(labels)
+        parts = [self.action, request.get_full_path()]
+        parts += [f'{label}:{version}' for label, (version, _)
+                  in versions.items()]
+        if self.action in self.user_dependent_actions:
+            parts.append(f'user:{request.user.pk}')
+        etag = quote_etag(md5('|'.join(parts).encode()).hexdigest())
+        last_modified = max(
+            (modified for _, modified in versions.values() if modified),
+            default=None,
+        )
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        return etag, last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            if self.action in self.user_dependent_actions:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin(ModelVersionsMixin):
+    """Mixin общего кеша ответов для анонимных пользователей.
+
+    Ключ строится из нормализованных параметров cache_query_params
+    и версий моделей cache_models, так что любое изменение этих моделей
+    делает старые записи недоступными. После CACHE_FRESH_SECONDS запись
+    считается устаревшей: один запрос пересчитывает ее, остальные
+    в это время получают устаревший ответ. При промахе ответ считает
+    только один запрос, остальные ждут его результата.
+    """
+
+    cache_models = ()
+    cache_actions = ('list', 'retrieve')
+    cache_query_params = ()
+
+    def get_cache_key(self, request):
+        versions = self.get_model_versions(self.cache_models)
+        parts = [
+            self.basename,
+            self.action,
+            request.get_host(),
+            str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)),
+        ]
+        parts += [f'{label}:{version}' for label, (version, _)
+                  in versions.items()]
+        for name in self.cache_query_params:
+            values = sorted(set(request.query_params.getlist(name)))
+            if values:
+                parts.append(f'{name}={",".join(values)}')
+        return 'response:' + md5('|'.join(parts).encode()).hexdigest()
+
+    def store_response(self, key, response):
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(
+                key,
+                (time.time() + CACHE_FRESH_SECONDS, response.data),
+                CACHE_FRESH_SECONDS + CACHE_STALE_SECONDS,
+            )
+        return response
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (
+            self.action not in self.cache_actions
+            or request.user.is_authenticated
+        ):
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            return Response(entry[1], headers={'X-Cache': 'HIT'})
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, CACHE_LOCK_SECONDS):
+            try:
+                response = handler(request, *args, **kwargs)
+                return self.store_response(key, response)
+            finally:
+                cache.delete(lock_key)
+        if entry is not None:
+            return Response(entry[1], headers={'X-Cache': 'STALE'})
+        deadline = time.time() + CACHE_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(CACHE_POLL_SECONDS)
+            entry = cache.get(key)
+            if entry is not None:
+                return Response(entry[1], headers={'X-Cache': 'HIT'})
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
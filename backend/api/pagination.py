@@ -1,6 +1,75 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+PAGE_SIZE: int = 12
+MAX_PAGE_SIZE: int = 100
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсорная пагинация без COUNT и OFFSET-сканирования.
+
+    Курсор хранит значение первого поля сортировки, поэтому сортировать
+    можно только по неизменяемым полям из ordering, последнее из которых
+    уникально и добавляется в конец, если его нет. Явная сортировка
+    по аннотациям и изменяемым счетчикам отклоняется, а сортировка
+    по релевантности, которую OrderingFilter view добавляет сам,
+    заменяется на ordering.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-pub_date', 'id')
+
+    def is_ordering_requested(self, request, view):
+        return any(
+            request.query_params.get(backend.ordering_param)
+            for backend in getattr(view, 'filter_backends', ())
+            if hasattr(backend, 'ordering_param')
+        )
+
+    def get_ordering(self, request, queryset, view):
+        if not self.is_ordering_requested(request, view):
+            return self.ordering
+        ordering = super().get_ordering(request, queryset, view)
+        fields = [field.lstrip('-') for field in self.ordering]
+        if any(field.lstrip('-') not in fields for field in ordering):
+            raise ValidationError({
+                'ordering': 'С параметром cursor доступна сортировка '
+                            f'только по полям: {", ".join(fields)}.'
+            })
+        if not any(field.lstrip('-') == fields[-1] for field in ordering):
+            ordering += (self.ordering[-1],)
+        return ordering
 
 
 class LimitPagePagination(PageNumberPagination):
-    page_size = 12
+    """Постраничная пагинация с параметром limit.
+
+    Если в запросе передан параметр cursor (в том числе пустой),
+    выдача переключается на курсорную пагинацию в порядке атрибута
+    cursor_ordering view; явно запрошенная через OrderingFilter
+    сортировка допускается только по его полям.
+    """
+
+    page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = LimitCursorPagination()
+        self.cursor_paginator.cursor_query_param = self.cursor_query_param
+        self.cursor_paginator.ordering = getattr(
+            view, 'cursor_ordering', LimitCursorPagination.ordering
+        )
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
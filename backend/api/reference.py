@@ -0,0 +1,132 @@
+"""Эталонные сериализаторы ответов на чтение.
+
+Повторяют RecipeSerializer, UserSerializer и SubscriptionSerializer
+в том виде, в каком они были до перехода списков на
+api.representations, и отличаются от них только полем image_variants,
+добавленным к рецептам. Ответы API не должны расходиться с ними:
+это проверяет api.tests, а команда serialization_benchmark сравнивает
+с ними скорость быстрых представлений.
+"""
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from .serializers import ImageVariantsField, TagSerializer
+from recipes.models import Recipe, RecipeIngredient
+from users.models import Subscription, User
+
+
+class ShortRecipeSerializer(serializers.ModelSerializer):
+    """Короткий сериализатор рецептов."""
+
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class UserSerializer(serializers.ModelSerializer):
+    """Сериализатор пользователей."""
+
+    is_subscribed = serializers.SerializerMethodField()
+
+    def get_is_subscribed(self, obj):
+        user = self.context.get('request').user
+        if user.is_anonymous or user == obj:
+            return False
+        return Subscription.objects.filter(
+            user=user, author=obj
+        ).exists()
+
+    class Meta:
+        model = User
+        fields = (
+            'email',
+            'id',
+            'username',
+            'first_name',
+            'last_name',
+            'is_subscribed',
+        )
+
+
+class SubscriptionSerializer(UserSerializer):
+    """Сериализатор подписки."""
+
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.SerializerMethodField()
+
+    def get_recipes(self, obj):
+        request = self.context.get('request')
+        limit = request.query_params.get('recipes_limit')
+        recipes = obj.recipes.all()
+        if limit:
+            recipes = recipes[:int(limit)]
+        serializer = ShortRecipeSerializer(recipes, many=True)
+        return serializer.data
+
+    def get_recipes_count(self, obj):
+        return obj.recipes.count()
+
+    class Meta:
+        model = User
+        fields = UserSerializer.Meta.fields + (
+            'recipes',
+            'recipes_count',
+        )
+
+
+class RecipeIngredientSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиентов в рецепте."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'name', 'amount', 'measurement_unit')
+
+
+class RecipeSerializer(serializers.ModelSerializer):
+    """Сериализатор рецептов."""
+
+    tags = TagSerializer(many=True, read_only=True)
+    author = UserSerializer(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        many=True, source='ingredient_list'
+    )
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    image = Base64ImageField()
+    image_variants = ImageVariantsField()
+
+    def request_user_recipe_exists(self, recipe_queryset):
+        user = self.context.get('request').user
+        if user.is_anonymous:
+            return False
+        return recipe_queryset.filter(user=user).exists()
+
+    def get_is_favorited(self, obj):
+        return self.request_user_recipe_exists(obj.favorites)
+
+    def get_is_in_shopping_cart(self, obj):
+        return self.request_user_recipe_exists(obj.shopping_cart)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'name',
+            'image',
+            'image_variants',
+            'text',
+            'cooking_time'
+        )
@@ -0,0 +1,71 @@
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+RELATION_FIELDS = {
+    Subscription: 'author_id',
+    Favorite: 'recipe_id',
+    ShoppingCart: 'recipe_id',
+}
+
+
+class UserRelations:
+    """Подписки, избранное и корзина пользователя для объектов ответа.
+
+    Связи читаются одним запросом на модель для всех id, переданных
+    в load(), с условием field__in=<id страницы>; уже проверенные id
+    повторно не запрашиваются.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.checked = {model: set() for model in RELATION_FIELDS}
+        self.found = {model: set() for model in RELATION_FIELDS}
+
+    def get_relations(self, model):
+        return model.objects.filter(user=self.user)
+
+    def load(self, model, ids):
+        if self.user.is_anonymous:
+            return
+        missing = set(ids) - self.checked[model]
+        if not missing:
+            return
+        field = RELATION_FIELDS[model]
+        self.found[model].update(
+            self.get_relations(model).filter(
+                **{f'{field}__in': missing}
+            ).values_list(field, flat=True)
+        )
+        self.checked[model].update(missing)
+
+    def load_recipes(self, recipes):
+        """Загружает флаги избранного и корзины рецептов и подписки
+        на их авторов: по запросу на модель связи.
+        """
+        recipe_ids = [recipe.pk for recipe in recipes]
+        self.load(Favorite, recipe_ids)
+        self.load(ShoppingCart, recipe_ids)
+        self.load(Subscription, [recipe.author_id for recipe in recipes])
+
+    def contains(self, model, target_id):
+        self.load(model, (target_id,))
+        return target_id in self.found[model]
+
+    def all_ids(self, model):
+        """Все id связанных объектов пользователя одним запросом."""
+        if self.user.is_anonymous:
+            return []
+        field = RELATION_FIELDS[model]
+        return sorted(
+            self.get_relations(model).values_list(field, flat=True)
+        )
+
+
+def get_relations(request):
+    """UserRelations текущего пользователя, общий для всего запроса."""
+    relations = request.__dict__.get('_user_relations')
+    if relations is None or relations.user != request.user:
+        relations = request.__dict__['_user_relations'] = UserRelations(
+            request.user
+        )
+    return relations
@@ -0,0 +1,166 @@
+"""Быстрое построение ответов списков из строк .values().
+
+Функции повторяют вывод TagSerializer, IngredientSerializer
+и эталонных сериализаторов api.reference поле в поле и в том же
+порядке ключей, но не создают экземпляры моделей и полей DRF.
+Совпадение ответов с эталоном проверяет api.tests, выигрыш
+по времени показывает команда serialization_benchmark.
+"""
+from collections import defaultdict
+
+from .timing import timed_serialization
+from recipes.images import VARIANT_SIZES, variant_urls
+from recipes.models import Recipe, RecipeIngredient
+
+TAG_FIELDS = ('id', 'name', 'slug', 'color')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+SHORT_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'variants_image', 'cooking_time'
+)
+
+image_storage = Recipe._meta.get_field('image').storage
+
+
+@timed_serialization()
+def tag_list(queryset):
+    return list(queryset.values(*TAG_FIELDS))
+
+
+@timed_serialization()
+def ingredient_list(queryset):
+    return list(queryset.values(*INGREDIENT_FIELDS))
+
+
+def absolute(url, request):
+    if url is None or request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def image_fields(name, variants_image, request=None):
+    """Поля image и image_variants для файла name; варианты готовы,
+    если variants_image совпадает с name.
+    """
+    if not name:
+        return None, {variant: None for variant in VARIANT_SIZES}
+    url = image_storage.url(name)
+    return absolute(url, request), {
+        variant: absolute(variant_url, request)
+        for variant, variant_url
+        in variant_urls(name, url, variants_image == name).items()
+    }
+
+
+def user_data(user, is_subscribed=False):
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': is_subscribed,
+    }
+
+
+def recipe_tags(recipe_ids):
+    """recipe_id -> список тегов в порядке Tag.Meta.ordering."""
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name', 'tag_id').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__slug', 'tag__color'
+    )
+    for recipe_id, *values in rows:
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+    return tags
+
+
+def recipe_ingredients(recipe_ids):
+    """recipe_id -> список ингредиентов в порядке добавления."""
+    ingredients = defaultdict(list)
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name', 'amount',
+        'ingredient__measurement_unit',
+    )
+    for recipe_id, *values in rows:
+        ingredients[recipe_id].append(
+            dict(zip(('id', 'name', 'amount', 'measurement_unit'), values))
+        )
+    return ingredients
+
+
+@timed_serialization()
+def recipe_list(recipes, request=None):
+    """Представления RecipeSerializer без пользовательских флагов.
+
+    recipes - рецепты с загруженным author; теги и ингредиенты
+    читаются двумя запросами на весь список.
+    """
+    recipe_ids = [recipe.pk for recipe in recipes]
+    tags = recipe_tags(recipe_ids)
+    ingredients = recipe_ingredients(recipe_ids)
+    data = []
+    for recipe in recipes:
+        image, image_variants = image_fields(
+            recipe.image.name, recipe.variants_image, request
+        )
+        data.append({
+            'id': recipe.pk,
+            'tags': tags[recipe.pk],
+            'author': user_data(recipe.author),
+            'ingredients': ingredients[recipe.pk],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': recipe.name,
+            'image': image,
+            'image_variants': image_variants,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        })
+    return data
+
+
+def short_recipes(author_ids, limit=None):
+    """author_id -> представления ShortRecipeSerializer рецептов автора.
+
+    С limit рецепты каждого автора ограничиваются в базе одним
+    оконным запросом. URL изображений относительные, как у
+    ShortRecipeSerializer без request в контексте.
+    """
+    queryset = Recipe.objects.filter(author_id__in=author_ids)
+    fields = ('author_id', *SHORT_RECIPE_FIELDS)
+    if limit is None:
+        rows = queryset.order_by('-pub_date', 'id').values_list(*fields)
+    else:
+        rows = queryset.latest_by_author(limit, *fields)
+    recipes = defaultdict(list)
+    for (
+        author_id, recipe_id, name, image, variants_image, cooking_time
+    ) in rows:
+        image, image_variants = image_fields(image, variants_image)
+        recipes[author_id].append({
+            'id': recipe_id,
+            'name': name,
+            'image': image,
+            'image_variants': image_variants,
+            'cooking_time': cooking_time,
+        })
+    return recipes
+
+
+@timed_serialization()
+def subscription_list(authors, limit=None):
+    """Представления SubscriptionSerializer для авторов, на которых
+    подписан пользователь.
+    """
+    recipes = short_recipes([author.pk for author in authors], limit)
+    return [
+        {
+            **user_data(author, is_subscribed=True),
+            'recipes': recipes[author.pk],
+            'recipes_count': author.recipes_count,
+        }
+        for author in authors
+    ]
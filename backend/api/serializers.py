@@ -1,12 +1,41 @@
-from django.db import transaction
-from django.shortcuts import get_object_or_404
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import models, transaction
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
-from rest_framework import serializers, validators
-
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from rest_framework import serializers
+
+from .mixins import ModelVersionsMixin
+from .relations import get_relations
+from .representations import recipe_list
+from .timing import timed_serialization
+from recipes.images import get_variant_urls
+from recipes.models import (Favorite, Ingredient, ModelVersion, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.signals import muted_signals
 from users.models import Subscription, User
 
+MAX_BATCH_SIZE: int = 100
+RECIPE_CACHE_SECONDS: int = 60 * 60
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+
+class SubscriptionParamsSerializer(serializers.Serializer):
+    """Параметры запроса страницы подписок."""
+
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тегов."""
@@ -24,12 +53,33 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ImageVariantsField(serializers.Field):
+    """URL уменьшенных вариантов изображения рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        urls = get_variant_urls(value)
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {
+            variant: url and request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Коротый сериализатор рецептов."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -41,18 +91,31 @@ class UserCreateSerializer(UserCreateSerializer):
         )
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """Список пользователей, подписки на которых читаются одним
+    запросом на страницу.
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.Manager) else data)
+        request = self.context.get('request')
+        if request is not None:
+            get_relations(request).load(
+                Subscription, [user.pk for user in users]
+            )
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор пользователей."""
 
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous or user == obj:
+        request = self.context.get('request')
+        if request is None:
             return False
-        return Subscription.objects.filter(
-            user=user, author=obj
-        ).exists()
+        return get_relations(request).contains(Subscription, obj.pk)
 
     class Meta:
         model = User
@@ -65,6 +128,7 @@ class UserSerializer(serializers.ModelSerializer):
             'is_subscribed',
         )
         read_only_fields = ('id', 'is_subscribed',)
+        list_serializer_class = UserListSerializer
 
 
 class SubscriptionSerializer(UserSerializer):
@@ -74,20 +138,15 @@ class SubscriptionSerializer(UserSerializer):
     recipes_count = serializers.SerializerMethodField()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
+        limit = self.context.get('recipes_limit')
         recipes = obj.recipes.all()
-        if limit:
-            try:
-                limit = int(limit)
-                recipes = recipes[:limit]
-            except ValueError:
-                pass
+        if limit is not None:
+            recipes = recipes[:limit]
         serializer = ShortRecipeSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     class Meta:
         model = User
@@ -97,40 +156,6 @@ class SubscriptionSerializer(UserSerializer):
         )
 
 
-class CreateSubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор для подписок."""
-
-    def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.author,
-            context={'request': self.context.get('request')}
-        ).data
-
-    class Meta:
-        model = Subscription
-        fields = ('user', 'author', )
-        validators = [
-            validators.UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=('user', 'author'),
-            )
-        ]
-
-
-class RecipeIngredientSerializer(serializers.ModelSerializer):
-    """Сериализатор ингредиентов в рецепте."""
-
-    id = serializers.ReadOnlyField(source='ingredient.id')
-    name = serializers.ReadOnlyField(source='ingredient.name')
-    measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit'
-    )
-
-    class Meta:
-        model = RecipeIngredient
-        fields = ('id', 'name', 'amount', 'measurement_unit')
-
-
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор создании ингредиентов в рецепте."""
 
@@ -149,56 +174,136 @@ class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор рецептов."""
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов, общие части которых берутся из кеша одним
+    запросом к нему.
+    """
 
-    tags = TagSerializer(many=True, read_only=True)
-    author = UserSerializer(read_only=True)
-    ingredients = RecipeIngredientSerializer(
-        many=True, source='ingredient_list'
-    )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.represent_many(list(recipes))
 
-    def request_user_recipe_exists(self, recipe_queryset):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return recipe_queryset.filter(user=user).exists()
 
-    def get_is_favorited(self, obj):
-        return self.request_user_recipe_exists(obj.favorites)
+class RecipeSerializer(serializers.BaseSerializer):
+    """Сериализатор рецептов только для чтения.
 
-    def get_is_in_shopping_cart(self, obj):
-        return self.request_user_recipe_exists(obj.shopping_cart)
+    Представление рецепта без пользовательских флагов кешируется
+    по ключу из даты изменения рецепта, данных автора и версий тегов
+    и ингредиентов. При выдаче в него подставляются только флаги
+    избранного, корзины и подписки на автора. Промахи кеша строятся
+    функцией representations.recipe_list; формат ответа закреплен
+    эталонными сериализаторами api.reference.
+    """
 
-    class Meta:
-        model = Recipe
-        fields = (
-            'id',
-            'tags',
-            'author',
-            'ingredients',
-            'is_favorited',
-            'is_in_shopping_cart',
-            'name',
-            'image',
-            'text',
-            'cooking_time'
+    def get_relations(self):
+        request = self.context.get('request')
+        return None if request is None else get_relations(request)
+
+    def get_versions(self):
+        """Версии тегов и ингредиентов; если их уже прочитал view,
+        повторного запроса нет.
+        """
+        labels = (Tag._meta.label_lower, Ingredient._meta.label_lower)
+        view = self.context.get('view')
+        if isinstance(view, ModelVersionsMixin):
+            return view.get_model_versions(labels)
+        return ModelVersion.get_many(*labels)
+
+    def get_cache_key(self, recipe, versions):
+        request = self.context.get('request')
+        author = recipe.author
+        parts = [
+            recipe.modified.isoformat(),
+            *versions,
+            author.email,
+            author.username,
+            author.first_name,
+            author.last_name,
+            request.build_absolute_uri('/') if request else '',
+        ]
+        digest = md5('|'.join(parts).encode()).hexdigest()
+        return f'recipe:{recipe.pk}:{digest}'
+
+    def is_cacheable(self, data):
+        """Пока варианты изображения не готовы, вместо них отдается
+        оригинал; такое представление не кешируется.
+        """
+        return data['image'] not in data['image_variants'].values()
+
+    def add_user_flags(self, data, recipe):
+        relations = self.get_relations()
+        if relations is None:
+            return data
+        data['is_favorited'] = relations.contains(Favorite, recipe.pk)
+        data['is_in_shopping_cart'] = relations.contains(
+            ShoppingCart, recipe.pk
         )
+        data['author'] = {
+            **data['author'],
+            'is_subscribed': relations.contains(
+                Subscription, recipe.author_id
+            ),
+        }
+        return data
+
+    @timed_serialization()
+    def represent_many(self, recipes):
+        versions = [
+            f'{label}:{version}' for label, (version, _)
+            in self.get_versions().items()
+        ]
+        keys = {
+            recipe.pk: self.get_cache_key(recipe, versions)
+            for recipe in recipes
+        }
+        shared = cache.get_many(keys.values())
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in shared
+        ]
+        if missing:
+            fresh = {
+                keys[recipe.pk]: data for recipe, data in zip(
+                    missing,
+                    recipe_list(missing, self.context.get('request')),
+                )
+            }
+            cache.set_many(
+                {
+                    key: data for key, data in fresh.items()
+                    if self.is_cacheable(data)
+                },
+                RECIPE_CACHE_SECONDS,
+            )
+            shared.update(fresh)
+        relations = self.get_relations()
+        if relations is not None:
+            relations.load_recipes(recipes)
+        return [
+            self.add_user_flags(dict(shared[keys[recipe.pk]]), recipe)
+            for recipe in recipes
+        ]
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    class Meta:
+        list_serializer_class = RecipeListSerializer
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор создания рецептов."""
+    """Сериализатор создания рецептов.
+
+    Существование ингредиентов и тегов проверяется одним запросом
+    на каждую модель, а при обновлении в базу уходят только
+    изменившиеся строки ингредиентов и тегов.
+    """
 
     ingredients = CreateRecipeIngredientSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all()
-    )
-    image = Base64ImageField(represent_in_base64=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = Base64ImageField()
 
     def to_representation(self, instance):
+        instance = Recipe.objects.select_related('author').get(pk=instance.pk)
         serializer = RecipeSerializer(
             instance,
             context=self.context
@@ -209,53 +314,119 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         unique_ingredients = {ingredient['id'] for ingredient in value}
         if len(unique_ingredients) != len(value):
             raise serializers.ValidationError('Ингредиенты повторяются.')
+        missing = unique_ingredients - set(
+            Ingredient.objects.filter(
+                id__in=unique_ingredients
+            ).values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не существуют: {sorted(missing)}.'
+            )
         return value
 
     def validate_tags(self, value):
         if len(set(value)) != len(value):
             raise serializers.ValidationError('Теги повторяются.')
-        return value
-
-    def create_ingredients(self, recipe, ingredients):
-        RecipeIngredient.objects.bulk_create(
-            [
-                RecipeIngredient(
-                    recipe=recipe,
-                    ingredient=get_object_or_404(
-                        Ingredient, pk=ingredient['id']
-                    ),
-                    amount=ingredient['amount']
-                )
-                for ingredient in ingredients
-            ]
+        missing = set(value) - set(
+            Tag.objects.filter(id__in=value).values_list('id', flat=True)
         )
+        if missing:
+            raise serializers.ValidationError(
+                f'Теги не существуют: {sorted(missing)}.'
+            )
+        return value
 
-    def add_ingredients_and_tags_to_recipe(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        self.create_ingredients(recipe, ingredients)
-        recipe.tags.set(tags)
-        return validated_data
+    def set_ingredients(self, recipe, ingredients, old_rows=None):
+        """Приводит ингредиенты рецепта к ingredients.
+
+        old_rows - словарь ingredient_id -> RecipeIngredient текущих строк.
+        """
+        old_rows = old_rows or {}
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        to_create = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in old_rows
+        ]
+        to_update = []
+        for ingredient_id, row in old_rows.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [
+            row.pk for ingredient_id, row in old_rows.items()
+            if ingredient_id not in new_amounts
+        ]
+        if to_delete:
+            with muted_signals():
+                RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if to_delete or to_update or to_create:
+            ModelVersion.bump(RecipeIngredient._meta.label_lower)
+
+    def set_tags(self, recipe, tags, old_tags=()):
+        through = Recipe.tags.through
+        old_tags = set(old_tags)
+        to_delete = old_tags - set(tags)
+        to_create = set(tags) - old_tags
+        if to_delete:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=to_delete
+            ).delete()
+        if to_create:
+            through.objects.bulk_create(
+                [through(recipe=recipe, tag_id=tag_id) for tag_id in to_create]
+            )
 
     @transaction.atomic
     def create(self, validated_data):
-        author = self.context.get('request').user
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(
-            author=author,
-            name=validated_data.pop('name'),
-            image=validated_data.pop('image'),
-            text=validated_data.pop('text'),
-            cooking_time=validated_data.pop('cooking_time')
+            author=self.context.get('request').user, **validated_data
         )
-        self.add_ingredients_and_tags_to_recipe(recipe, validated_data)
+        self.set_ingredients(recipe, ingredients)
+        self.set_tags(recipe, tags)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        validated_data = self.add_ingredients_and_tags_to_recipe(
-            instance, validated_data
-        )
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            old_rows = {
+                row.ingredient_id: row
+                for row in RecipeIngredient.objects.filter(recipe=instance)
+            }
+            old_amounts = {
+                ingredient_id: row.amount
+                for ingredient_id, row in old_rows.items()
+            }
+            self.set_ingredients(instance, ingredients, old_rows)
+            ShoppingListItem.objects.change_recipe(
+                instance.id,
+                old_amounts,
+                {
+                    ingredient['id']: ingredient['amount']
+                    for ingredient in ingredients
+                },
+            )
+        if tags is not None:
+            self.set_tags(
+                instance,
+                tags,
+                instance.tags.values_list('id', flat=True),
+            )
         return super().update(instance, validated_data)
 
     class Meta:
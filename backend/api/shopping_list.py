@@ -0,0 +1,145 @@
+import csv
+import io
+import os
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+SHOPPING_LIST_TITLE: str = 'Список покупок'
+SHOPPING_LIST_FILENAME: str = 'shopping_list'
+PDF_FONT_NAME: str = 'ShoppingListFont'
+PDF_FALLBACK_FONT: str = 'Helvetica'
+PDF_FONT_SIZE: int = 12
+PDF_LINE_HEIGHT: float = 7 * mm
+PDF_MARGIN: float = 20 * mm
+PDF_CACHE_SECONDS: int = 60 * 60
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def get_shopping_list(user):
+    """Суммарное количество каждого ингредиента в корзине пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by('ingredient__name')
+
+
+def format_line(ingredient):
+    return (
+        f'{ingredient["ingredient__name"]} - '
+        f'{ingredient["amount"]} '
+        f'({ingredient["ingredient__measurement_unit"]})'
+    )
+
+
+def stream_text(ingredients):
+    yield f'{SHOPPING_LIST_TITLE}\n'
+    for ingredient in ingredients.iterator():
+        yield f'{format_line(ingredient)}\n'
+
+
+class EchoBuffer:
+    """Псевдобуфер, возвращающий записанную строку для csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(ingredients):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients.iterator():
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['amount'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_FONT_PATH):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_FONT_PATH)
+    )
+    return PDF_FONT_NAME
+
+
+def render_pdf(ingredients):
+    """Рисует список покупок в PDF. Не обращается к базе данных."""
+    buffer = io.BytesIO()
+    font = get_pdf_font()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(SHOPPING_LIST_TITLE)
+    width, height = A4
+    lines = [SHOPPING_LIST_TITLE, ''] + [
+        format_line(ingredient) for ingredient in ingredients
+    ]
+    position = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for line in lines:
+        if position < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            position = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, position, line)
+        position -= PDF_LINE_HEIGHT
+    pdf.save()
+    return buffer.getvalue()
+
+
+def get_pdf_cache_key(ingredients):
+    """Ключ PDF по строкам списка покупок, из которых он рисуется."""
+    content = '\n'.join(format_line(ingredient) for ingredient in ingredients)
+    return 'shopping_list_pdf:' + md5(content.encode()).hexdigest()
+
+
+def get_pdf(user):
+    """PDF списка покупок пользователя.
+
+    Рисуется в потоке запроса и кешируется по содержимому списка,
+    поэтому повторная загрузка того же списка, в том числе другим
+    пользователем, берет готовый файл из кеша.
+    """
+    ingredients = list(get_shopping_list(user))
+    key = get_pdf_cache_key(ingredients)
+    content = cache.get(key)
+    if content is None:
+        content = render_pdf(ingredients)
+        cache.set(key, content, PDF_CACHE_SECONDS)
+    return content
+
+
+def shopping_list_response(user, file_format):
+    """Ответ со списком покупок в формате txt, csv или pdf."""
+    if file_format == 'pdf':
+        response = HttpResponse(
+            get_pdf(user), content_type=CONTENT_TYPES[file_format]
+        )
+    else:
+        stream = stream_csv if file_format == 'csv' else stream_text
+        response = StreamingHttpResponse(
+            stream(get_shopping_list(user)),
+            content_type=CONTENT_TYPES[file_format],
+        )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{SHOPPING_LIST_FILENAME}.{file_format}"'
+    )
+    return response
@@ -0,0 +1,601 @@
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import reference
+from .representations import ingredient_list, tag_list
+from .serializers import IngredientSerializer, TagSerializer
+from recipes.images import mark_ready
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, SimilarRecipe, Tag, TimelineEntry)
+from users.models import Subscription, User
+
+IMAGE_NAME: str = 'recipes/images/contract.jpg'
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+class FixtureMixin:
+    """Набор данных: три автора, подписчик, теги, ингредиенты
+    и рецепты с разным числом тегов и ингредиентов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+                password='password',
+            )
+            for number in range(3)
+        ]
+        cls.follower = User.objects.create_user(
+            email='follower@example.com',
+            username='follower',
+            first_name='Подписчик',
+            last_name='Подписчиков',
+            password='password',
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag{number}',
+                color=f'#00000{number}',
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.recipes = []
+        for number in range(9):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}',
+                text='Описание "с кавычками" и переносом\nстроки',
+                cooking_time=number + 1,
+                author=cls.authors[number % 3],
+                image=IMAGE_NAME,
+            )
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(number + shift) % 6],
+                    amount=shift + 1,
+                )
+                for shift in range(number % 4 + 1)
+            )
+            cls.recipes.append(recipe)
+        for author in cls.authors[:2]:
+            Subscription.objects.create(user=cls.follower, author=author)
+
+    def get_request(self, user=None, query=None):
+        request = Request(APIRequestFactory().get('/api/', query))
+        if user is not None:
+            request.user = user
+        return request
+
+
+class RepresentationContractTest(FixtureMixin, TestCase):
+    """Ответы API на чтение дают те же байты JSON, что и эталонные
+    сериализаторы api.reference, для анонима и для пользователя
+    с избранным, корзиной и подписками, с пустым и с заполненным кешем.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.follower, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.follower, recipe=recipe)
+            for recipe in cls.recipes[1::3]
+        )
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in cls.recipes[::3]]
+        ).update(variants_image=IMAGE_NAME)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_users(self):
+        return (None, self.follower)
+
+    def get_client(self, user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def assertMatches(self, user, url, reference, results=True):
+        """Ответ url совпадает с reference(request) дважды: при
+        построении представлений и при чтении их из кеша.
+        """
+        query = dict(parse_qsl(urlsplit(url).query))
+        expected = render(reference(self.get_request(user, query)))
+        for attempt in ('cold', 'warm'):
+            with self.subTest(user=user, url=url, attempt=attempt):
+                response = self.get_client(user).get(url)
+                self.assertEqual(response.status_code, 200)
+                data = response.data['results'] if results else response.data
+                self.assertEqual(render(data), expected)
+
+    def test_tags(self):
+        tags = Tag.objects.all()
+        self.assertEqual(
+            render(tag_list(tags)),
+            render(TagSerializer(tags, many=True).data),
+        )
+
+    def test_ingredients(self):
+        ingredients = Ingredient.objects.all()
+        self.assertEqual(
+            render(ingredient_list(ingredients)),
+            render(IngredientSerializer(ingredients, many=True).data),
+        )
+
+    def test_recipes(self):
+        recipes = Recipe.objects.order_by('-pub_date', 'id')
+        for user in self.get_users():
+            self.assertMatches(
+                user, '/api/recipes/?limit=100',
+                lambda request: reference.RecipeSerializer(
+                    recipes, many=True, context={'request': request}
+                ).data,
+            )
+            for recipe in recipes.filter(
+                pk__in=[recipe.pk for recipe in self.recipes[:4]]
+            ):
+                self.assertMatches(
+                    user, f'/api/recipes/{recipe.pk}/',
+                    lambda request: reference.RecipeSerializer(
+                        recipe, context={'request': request}
+                    ).data,
+                    results=False,
+                )
+
+    def test_feed(self):
+        self.assertMatches(
+            self.follower, '/api/recipes/feed/?limit=100',
+            lambda request: reference.RecipeSerializer(
+                Recipe.objects.filter(
+                    author__in=self.authors[:2]
+                ).order_by('-pub_date', 'id'),
+                many=True,
+                context={'request': request},
+            ).data,
+        )
+
+    def test_users(self):
+        for user in self.get_users():
+            self.assertMatches(
+                user, '/api/users/?limit=100',
+                lambda request: reference.UserSerializer(
+                    User.objects.order_by('id'),
+                    many=True,
+                    context={'request': request},
+                ).data,
+            )
+
+    def test_subscriptions(self):
+        authors = [
+            subscription.author for subscription in
+            Subscription.objects.filter(
+                user=self.follower
+            ).select_related('author').order_by('id')
+        ]
+        for query in ('', '&recipes_limit=0', '&recipes_limit=1',
+                      '&recipes_limit=100'):
+            self.assertMatches(
+                self.follower, f'/api/users/subscriptions/?limit=100{query}',
+                lambda request: reference.SubscriptionSerializer(
+                    authors, many=True, context={'request': request}
+                ).data,
+            )
+
+
+class QueryBudgetTest(FixtureMixin, TestCase):
+    """Число запросов к базе на выдачу рецептов не зависит от размера
+    страницы. Кеш очищается перед каждым запросом, поэтому
+    представления строятся заново.
+
+    Список: число рецептов, рецепты с авторами, теги, ингредиенты
+    и версии моделей (для анонима - ключ кеша ответа, для
+    пользователя - ключ кеша рецептов), пользователю еще избранное,
+    корзина и подписки. Рецепт: те же запросы без числа рецептов,
+    версии читаются для валидаторов и ключа кеша одним запросом.
+    """
+
+    list_queries = {'anonymous': 5, 'authenticated': 8}
+    detail_queries = {'anonymous': 4, 'authenticated': 7}
+
+    def get_users(self):
+        return (('anonymous', None), ('authenticated', self.follower))
+
+    def get(self, user, url):
+        cache.clear()
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        for name, user in self.get_users():
+            for limit in (1, 12):
+                with self.subTest(user=name, limit=limit):
+                    with self.assertNumQueries(self.list_queries[name]):
+                        response = self.get(
+                            user, f'/api/recipes/?limit={limit}'
+                        )
+                    self.assertEqual(
+                        len(response.data['results']),
+                        min(limit, len(self.recipes)),
+                    )
+
+    def test_detail(self):
+        for name, user in self.get_users():
+            with self.subTest(user=name):
+                with self.assertNumQueries(self.detail_queries[name]):
+                    self.get(user, f'/api/recipes/{self.recipes[0].pk}/')
+
+
+class IngredientFilterTest(FixtureMixin, TestCase):
+    """Отбор рецептов по ингредиентам и сортировка по их покрытию."""
+
+    def test_coverage(self):
+        ids = [ingredient.pk for ingredient in self.ingredients[:2]]
+        response = APIClient().get(
+            '/api/recipes/',
+            {'ingredients': ','.join(map(str, ids)), 'limit': 100},
+        )
+        self.assertEqual(response.status_code, 200)
+        expected = {
+            recipe.pk: recipe.ingredient_list.filter(
+                ingredient_id__in=ids
+            ).count()
+            for recipe in self.recipes
+        }
+        found = [item['id'] for item in response.data['results']]
+        self.assertEqual(
+            set(found), {pk for pk, count in expected.items() if count}
+        )
+        coverage = [expected[pk] for pk in found]
+        self.assertEqual(coverage, sorted(coverage, reverse=True))
+
+    def test_exclude(self):
+        excluded = self.ingredients[0].pk
+        response = APIClient().get(
+            '/api/recipes/',
+            {'exclude_ingredients': excluded, 'limit': 100},
+        )
+        self.assertEqual(
+            {item['id'] for item in response.data['results']},
+            set(Recipe.objects.exclude(
+                ingredient_list__ingredient_id=excluded
+            ).values_list('pk', flat=True)),
+        )
+
+
+class FeedTest(FixtureMixin, TestCase):
+    """Лента подписок: рецепты автора из TimelineEntry и автора,
+    который читается при выдаче, идут одним списком от новых к старым.
+    """
+
+    def setUp(self):
+        self.push_author, self.pull_author = self.authors[:2]
+        with override_settings(FEED_FANOUT_FOLLOWERS=0):
+            TimelineEntry.objects.update_fanout([self.pull_author.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(self.follower)
+
+    def expected(self, authors):
+        return list(
+            Recipe.objects.filter(author__in=authors).order_by(
+                '-pub_date', 'id'
+            ).values_list('id', flat=True)
+        )
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def walk(self, url, link='next'):
+        ids = []
+        while url:
+            data = self.get_ids(url)
+            ids.extend(item['id'] for item in data['results'])
+            url = data[link]
+        return ids
+
+    def test_merge(self):
+        self.pull_author.refresh_from_db()
+        self.assertFalse(self.pull_author.feed_fanout)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.pull_author).exists()
+        )
+        data = self.get_ids('/api/recipes/feed/?limit=100')
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            self.expected(self.authors[:2]),
+        )
+        self.assertEqual(data['count'], 6)
+
+    def test_pages(self):
+        for limit in (1, 2, 4, 5):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.walk(f'/api/recipes/feed/?limit={limit}'),
+                    self.expected(self.authors[:2]),
+                )
+
+    def test_cursor(self):
+        expected = self.expected(self.authors[:2])
+        for limit in (1, 2, 4):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.walk(f'/api/recipes/feed/?cursor=&limit={limit}'),
+                    expected,
+                )
+        last = self.get_ids('/api/recipes/feed/?cursor=&limit=4')
+        last = self.get_ids(last['next'])
+        self.assertEqual(
+            self.walk(last['previous'], link='previous'), expected[:4]
+        )
+
+    def test_unsubscribe(self):
+        for author, remaining in (
+            (self.push_author, [self.pull_author]),
+            (self.pull_author, []),
+        ):
+            with self.subTest(author=author.username):
+                response = self.client.delete(
+                    f'/api/users/{author.pk}/subscribe/'
+                )
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(
+                    self.walk('/api/recipes/feed/?limit=2'),
+                    self.expected(remaining),
+                )
+
+    @override_settings(FEED_BACKFILL_RECIPES=2)
+    def test_rebuild(self):
+        """feed_rebuild добавляет в ленты столько же рецептов автора,
+        сколько подписка.
+        """
+        call_command('feed_rebuild', stdout=StringIO())
+        subscribed = list(TimelineEntry.objects.order_by(
+            'user_id', '-pub_date', 'recipe_id'
+        ).values_list('user_id', 'recipe_id'))
+        TimelineEntry.objects.all().delete()
+        TimelineEntry.objects.backfill(
+            self.follower.pk, [author.pk for author in self.authors[:2]]
+        )
+        self.assertEqual(len(subscribed), 4)
+        self.assertEqual(subscribed, list(TimelineEntry.objects.order_by(
+            'user_id', '-pub_date', 'recipe_id'
+        ).values_list('user_id', 'recipe_id')))
+
+
+class UserFlagsTest(FixtureMixin, TestCase):
+    """Фильтры и флаги избранного, корзины и подписки."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.follower)
+        Favorite.objects.bulk_create(
+            Favorite(user=self.follower, recipe=recipe)
+            for recipe in self.recipes[:2]
+        )
+        ShoppingCart.objects.create(
+            user=self.follower, recipe=self.recipes[1]
+        )
+
+    def get_results(self, query):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item for item in response.data['results']}
+
+    def test_filters(self):
+        for query, recipes in (
+            ('is_favorited=1', self.recipes[:2]),
+            ('is_in_shopping_cart=1', self.recipes[1:2]),
+            ('is_favorited=1&is_in_shopping_cart=1', self.recipes[1:2]),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    set(self.get_results(query)),
+                    {recipe.pk for recipe in recipes},
+                )
+
+    def test_flags(self):
+        followed = {author.pk for author in self.authors[:2]}
+        results = self.get_results('')
+        for recipe in self.recipes:
+            item = results[recipe.pk]
+            self.assertEqual(
+                (item['is_favorited'], item['is_in_shopping_cart'],
+                 item['author']['is_subscribed']),
+                (recipe in self.recipes[:2], recipe == self.recipes[1],
+                 recipe.author_id in followed),
+            )
+
+
+@override_settings(TOKEN_CACHE_ENABLED=False)
+class TokenAuthenticationTest(FixtureMixin, TestCase):
+    """Без общего кеша токен проверяется по базе на каждом запросе."""
+
+    def test_revoked_elsewhere(self):
+        client = APIClient()
+        token = Token.objects.create(user=self.follower)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Token._meta.db_table} WHERE key = %s',
+                (token.key,),
+            )
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+    def test_stats_for_staff(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='password',
+            first_name='Админ', last_name='Админов',
+        )
+        for user, status in ((self.follower, 403), (admin, 200)):
+            client = APIClient()
+            client.force_authenticate(user)
+            self.assertEqual(
+                client.get('/api/auth/token-cache/').status_code, status
+            )
+
+
+class CursorOrderingTest(FixtureMixin, TestCase):
+    """Курсорная пагинация принимает только сортировку по неизменяемым
+    полям с уникальным полем в конце.
+    """
+
+    def walk(self, url):
+        client = APIClient()
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_allowed(self):
+        ingredients = [ingredient.pk for ingredient in self.ingredients]
+        for query, expected in (
+            ('', ('-pub_date', 'id')),
+            ('ordering=pub_date', ('pub_date', 'id')),
+            (f'ingredients={ingredients[0]},{ingredients[1]}',
+             ('-pub_date', 'id')),
+        ):
+            with self.subTest(query=query):
+                recipes = Recipe.objects.all()
+                if query.startswith('ingredients'):
+                    recipes = recipes.with_ingredients(ingredients[:2])
+                self.assertEqual(
+                    self.walk(f'/api/recipes/?cursor=&limit=2&{query}'),
+                    list(recipes.order_by(*expected).values_list(
+                        'id', flat=True
+                    )),
+                )
+
+    def test_rejected(self):
+        for query in (
+            'ordering=-favorites_count',
+            'ordering=-in_carts_count,-pub_date',
+        ):
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/recipes/?cursor=&{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ordering', response.data)
+
+
+class SearchTest(FixtureMixin, TestCase):
+    """Поиск рецептов по названию и описанию."""
+
+    def test_rank(self):
+        recipes = list(Recipe.objects.search('рецепт 3').order_by(
+            '-search_rank', 'id'
+        ))
+        self.assertEqual(recipes[0], self.recipes[3])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5')
+    def test_without_fts(self):
+        with mock.patch('recipes.search.has_fts_table', return_value=False):
+            recipes = list(Recipe.objects.search('3 5').order_by('id'))
+        self.assertEqual(recipes, [self.recipes[3], self.recipes[5]])
+        self.assertEqual({recipe.search_rank for recipe in recipes}, {0.0})
+
+
+class SimilarRecipesTest(FixtureMixin, TestCase):
+    """Инкрементальный пересчет похожих рецептов."""
+
+    def get_similar(self, recipe):
+        return list(SimilarRecipe.objects.filter(recipe=recipe).order_by(
+            '-score', 'similar_id'
+        ).values_list('similar_id', flat=True))
+
+    def test_deleted_neighbour(self):
+        call_command('similar_recipes_update', top=2, stdout=StringIO())
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=self.get_similar(recipe)[0]).delete()
+        call_command('similar_recipes_update', top=2, stdout=StringIO())
+        incremental = self.get_similar(recipe)
+        self.assertFalse(
+            SimilarRecipe.objects.filter(similar__isnull=True).exists()
+        )
+        call_command(
+            'similar_recipes_update', top=2, full=True, stdout=StringIO()
+        )
+        self.assertEqual(len(incremental), 2)
+        self.assertEqual(incremental, self.get_similar(recipe))
+
+
+class ImageVariantsTest(FixtureMixin, TestCase):
+    """Готовность вариантов изображения хранится в рецепте, и при
+    выдаче хранилище не опрашивается.
+    """
+
+    def get_variants(self):
+        with mock.patch.object(
+            default_storage, 'exists', side_effect=AssertionError
+        ):
+            response = APIClient().get('/api/recipes/', {'limit': 9})
+        return {
+            item['id']: item['image_variants']['thumbnail']
+            for item in response.data['results']
+        }
+
+    def test_ready(self):
+        variants = self.get_variants()
+        self.assertTrue(all(
+            url.endswith(IMAGE_NAME) for url in variants.values()
+        ))
+        mark_ready((IMAGE_NAME,))
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        recipe.image = 'recipes/images/changed.jpg'
+        recipe.save()
+        variants = self.get_variants()
+        self.assertTrue(variants.pop(recipe.pk).endswith(recipe.image.name))
+        self.assertTrue(all(
+            '/variants/' in url for url in variants.values()
+        ))
+
+
+class ServerTimingTest(TestCase):
+    """Заголовок Server-Timing отдается только по настройке."""
+
+    def test_setting(self):
+        for enabled in (False, True):
+            with self.subTest(enabled=enabled):
+                with override_settings(SERVER_TIMING_ENABLED=enabled):
+                    response = APIClient().get('/api/tags/')
+                self.assertEqual(
+                    'Server-Timing' in response, enabled
+                )
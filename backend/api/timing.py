@@ -0,0 +1,160 @@
+import json
+import logging
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES_REPORTED: int = 5
+SQL_PREVIEW_LENGTH: int = 300
+
+current_timing = ContextVar('current_timing', default=None)
+
+
+class RequestTiming:
+    """Счетчики одного запроса: запросы к базе, время базы, построения
+    представлений и кодирования в JSON.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def total_time(self):
+        return perf_counter() - self.started
+
+    def duplicates(self, threshold):
+        return [
+            (sql, count)
+            for sql, count in self.statements.most_common(DUPLICATES_REPORTED)
+            if count >= threshold
+        ]
+
+
+def record_render_time(duration):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.render_time += duration
+
+
+@contextmanager
+def timed_serialization():
+    """Учитывает время построения представлений без времени базы.
+
+    Вложенные вызовы не учитываются повторно. Можно использовать
+    и как декоратор.
+    """
+    timing = current_timing.get()
+    if timing is None or timing.serializing:
+        yield
+        return
+    timing.serializing = True
+    started, db_started = perf_counter(), timing.db_time
+    try:
+        yield
+    finally:
+        timing.serializing = False
+        timing.serialize_time += (
+            perf_counter() - started - (timing.db_time - db_started)
+        )
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer, который учитывает время кодирования ответа в JSON."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            record_render_time(perf_counter() - started)
+
+
+class RequestTimingMiddleware:
+    """Замеряет запросы к базе, время базы, построения представлений
+    (serialize), кодирования в JSON (render) и всего запроса.
+
+    Результат отдается заголовком Server-Timing, если включен
+    SERVER_TIMING_ENABLED (по умолчанию только с DEBUG). Медленные запросы
+    и повторяющиеся SQL (признак N+1) пишутся в лог одной строкой JSON.
+    Сами замеры не зависят от DEBUG и не хранят текст запросов дольше одного
+    HTTP-запроса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = self.server_timing(timing)
+        self.report(request, response, timing)
+        return response
+
+    def server_timing(self, timing):
+        return ', '.join((
+            f'db;dur={timing.db_time * 1000:.1f};'
+            f'desc="{timing.queries} queries"',
+            f'serialize;dur={timing.serialize_time * 1000:.1f}',
+            f'render;dur={timing.render_time * 1000:.1f}',
+            f'total;dur={timing.total_time * 1000:.1f}',
+        ))
+
+    def report(self, request, response, timing):
+        total = timing.total_time * 1000
+        context = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(timing.db_time * 1000, 1),
+            'serialize_ms': round(timing.serialize_time * 1000, 1),
+            'render_ms': round(timing.render_time * 1000, 1),
+            'queries': timing.queries,
+        }
+        if total >= settings.SLOW_REQUEST_MS:
+            logger.warning(json.dumps(
+                {'event': 'slow_request', **context}, ensure_ascii=False
+            ))
+        duplicates = timing.duplicates(settings.DUPLICATE_QUERY_THRESHOLD)
+        if duplicates:
+            logger.warning(json.dumps(
+                {
+                    'event': 'duplicate_queries',
+                    **context,
+                    'duplicates': [
+                        {'sql': sql[:SQL_PREVIEW_LENGTH], 'count': count}
+                        for sql, count in duplicates
+                    ],
+                },
+                ensure_ascii=False,
+            ))
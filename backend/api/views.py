@@ -1,31 +1,78 @@
-from django.db.models import Sum
-from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import IngredientFilter, RecipeFilter
+from .authentication import token_cache
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .mixins import AnonymousCacheMixin, ConditionalGetMixin
 from .pagination import LimitPagePagination
 from .permissions import IsAuthorPermission
-from .serializers import (CreateRecipeSerializer, CreateSubscriptionSerializer,
+from .relations import get_relations
+from .representations import ingredient_list, subscription_list, tag_list
+from .serializers import (BatchIdsSerializer, CreateRecipeSerializer,
                           IngredientSerializer, RecipeSerializer,
-                          ShortRecipeSerializer, TagSerializer, UserSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                          ShortRecipeSerializer, SubscriptionParamsSerializer,
+                          SubscriptionSerializer, TagSerializer,
+                          UserSerializer)
+from .shopping_list import CONTENT_TYPES, shopping_list_response
+from recipes import services
+from recipes.feed import Feed
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (USER_PROFILE_LABEL, Favorite, Ingredient,
+                            ModelVersion, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, user_state_label)
 from users.models import Subscription, User
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def batch_results(outcomes):
+    return {
+        'results': [
+            {'id': target_id, 'status': outcome}
+            for target_id, outcome in outcomes.items()
+        ]
+    }
+
+
+def recipes_limit(request):
+    """Проверенный параметр recipes_limit или None, если его нет."""
+    serializer = SubscriptionParamsSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data.get('recipes_limit')
+
+
+class TokenCacheStatsView(APIView):
+    '''Статистика кеша токенов текущего процесса.'''
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     '''ViewSet тега.'''
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    conditional_models = (Tag,)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.list_rows, request, *args, **kwargs
+        )
+
+    def list_rows(self, request, *args, **kwargs):
+        return Response(tag_list(self.get_queryset()))
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     '''ViewSet ингредиента.'''
 
     queryset = Ingredient.objects.all()
@@ -33,6 +80,24 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    conditional_models = (Ingredient,)
+
+    def list(self, request, *args, **kwargs):
+        handler = (
+            self.search if 'name' in request.query_params
+            else self.list_rows
+        )
+        return self.conditional_response(handler, request, *args, **kwargs)
+
+    def list_rows(self, request, *args, **kwargs):
+        return Response(
+            ingredient_list(self.filter_queryset(self.get_queryset()))
+        )
+
+    def search(self, request, *args, **kwargs):
+        return Response(
+            ingredient_index.search(request.query_params['name'])
+        )
 
 
 class UserViewSet(viewsets.GenericViewSet):
@@ -41,6 +106,7 @@ class UserViewSet(viewsets.GenericViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = LimitPagePagination
+    cursor_ordering = ('id',)
 
     @action(
         detail=True,
@@ -51,22 +117,71 @@ class UserViewSet(viewsets.GenericViewSet):
     def subscribe(self, request, pk):
         author = get_object_or_404(User, id=pk)
         if request.method == 'POST':
-            serializer = CreateSubscriptionSerializer(
-                data={'user': request.user.id, 'author': pk},
-                context={'request': request},
+            limit = recipes_limit(request)
+            outcome = services.subscribe(request.user, (author.id,))[author.id]
+            if outcome == services.SELF_SUBSCRIPTION:
+                return Response(
+                    {'errors': 'Нельзя подписаться на самого себя.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if outcome == services.ALREADY_ADDED:
+                return Response(
+                    {'errors': 'Вы уже подписаны на этого автора.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            serializer = SubscriptionSerializer(
+                author,
+                context={'request': request, 'recipes_limit': limit},
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if Subscription.objects.filter(
-            user=request.user, author=author
-        ).exists():
-            subscription = get_object_or_404(
-                Subscription, user=request.user, author=author
-            )
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        if services.unsubscribe(
+            request.user, (author.id,)
+        )[author.id] == services.NOT_ADDED:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        url_path='subscribe',
+        url_name='subscribe-batch',
+        methods=('post', 'delete'),
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        handler = (
+            services.subscribe if request.method == 'POST'
+            else services.unsubscribe
+        )
+        return Response(batch_results(
+            handler(request.user, serializer.validated_data['ids'])
+        ))
+
+    @action(
+        detail=False,
+        url_path='me/state',
+        url_name='me-state',
+        methods=('get',),
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def state(self, request):
+        label = user_state_label(request.user.pk)
+        version = ModelVersion.get_many(label)[label][0]
+        etag = quote_etag(f'state-{request.user.pk}-{version}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            relations = get_relations(request)
+            response = Response({
+                'version': version,
+                'favorite_ids': relations.all_ids(Favorite),
+                'shopping_cart_ids': relations.all_ids(ShoppingCart),
+                'subscription_ids': relations.all_ids(Subscription),
+            })
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
 
     @action(
         detail=False,
@@ -75,49 +190,110 @@ class UserViewSet(viewsets.GenericViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = Subscription.objects.filter(user=request.user)
+        limit = recipes_limit(request)
+        queryset = Subscription.objects.filter(
+            user=request.user
+        ).select_related('author').order_by(*self.cursor_ordering)
         page = self.paginate_queryset(queryset)
-        serializer = CreateSubscriptionSerializer(
-            page,
-            many=True,
-            context={'request': request},
-        )
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(subscription_list(
+            [subscription.author for subscription in page], limit
+        ))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin, AnonymousCacheMixin, viewsets.ModelViewSet
+):
     '''ViewSet рецепта.'''
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorPermission,)
-    filter_backends = (DjangoFilterBackend,)
+    pagination_class = LimitPagePagination
+    conditional_models = (
+        Recipe,
+        RecipeIngredient,
+        Tag,
+        Ingredient,
+        USER_PROFILE_LABEL,
+    )
+    conditional_actions = ('retrieve',)
+    user_dependent_actions = ('retrieve',)
+    cache_models = (
+        Recipe, RecipeIngredient, Tag, Ingredient, USER_PROFILE_LABEL
+    )
+    cache_query_params = (
+        'tags', 'author', 'page', 'limit', 'cursor', 'ordering', 'search',
+        'ingredients', 'exclude_ingredients',
+    )
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    ordering = ('-pub_date', 'id')
     http_method_names = ('get', 'post', 'patch', 'delete')
 
-    def get_serializer_class(self):
+    def get_queryset(self):
         if self.action in ('list', 'retrieve'):
+            return Recipe.objects.select_related('author')
+        if self.action == 'feed':
+            return Feed(self.request.user.pk)
+        return Recipe.objects.all()
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeSerializer
         return CreateRecipeSerializer
 
-    def create_or_delete_recipe_m_to_m(self, request, pk, queryset):
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(permissions.IsAuthenticated,),
+        filter_backends=(),
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=('get',))
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
+        recipes = Recipe.objects.filter(
+            similar_to__recipe=recipe
+        ).order_by('-similar_to__score', 'id').select_related('author')
+        serializer = RecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    def create_or_delete_recipe_m_to_m(self, request, pk, model):
         recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            if queryset.filter(user=request.user, recipe=recipe).exists():
+            outcome = services.add_recipes(model, request.user, (recipe.id,))
+            if outcome[recipe.id] == services.ALREADY_ADDED:
                 return Response(
                     {'errors': 'Рецепт уже добавлен.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            queryset.create(user=request.user, recipe=recipe).save()
             serializer = ShortRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not queryset.filter(user=request.user, recipe=recipe).exists():
+        outcome = services.remove_recipes(model, request.user, (recipe.id,))
+        if outcome[recipe.id] == services.NOT_ADDED:
             return Response(
                 {'errors': 'Рецепт не был добавлен изначально.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        queryset.filter(user=request.user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def batch_recipe_m_to_m(self, request, model):
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        handler = (
+            services.add_recipes if request.method == 'POST'
+            else services.remove_recipes
+        )
+        return Response(batch_results(
+            handler(model, request.user, serializer.validated_data['ids'])
+        ))
+
     @action(
         detail=True,
         url_path='favorite',
@@ -125,9 +301,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def favorite(self, request, pk):
-        return self.create_or_delete_recipe_m_to_m(
-            request, pk, Favorite.objects
-        )
+        return self.create_or_delete_recipe_m_to_m(request, pk, Favorite)
+
+    @action(
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-batch',
+        methods=('post', 'delete'),
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        return self.batch_recipe_m_to_m(request, Favorite)
 
     @action(
         detail=True,
@@ -136,9 +320,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def shopping_cart(self, request, pk):
-        return self.create_or_delete_recipe_m_to_m(
-            request, pk, ShoppingCart.objects
-        )
+        return self.create_or_delete_recipe_m_to_m(request, pk, ShoppingCart)
+
+    @action(
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        methods=('post', 'delete'),
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_recipe_m_to_m(request, ShoppingCart)
 
     @action(
         detail=False,
@@ -147,23 +339,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        shopping_list = ['Список покупок\n']
-
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient["ingredient__name"]} - '
-                f'{ingredient["amount"]} '
-                f'({ingredient["ingredient__measurement_unit"]})\n'
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in CONTENT_TYPES:
+            return Response(
+                {'errors': 'Поддерживаемые форматы: '
+                           f'{", ".join(CONTENT_TYPES)}.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
-        )
-        return response
+        return shopping_list_response(request.user, file_format)
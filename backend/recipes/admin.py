@@ -1,22 +1,23 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+from .services import delete_recipes
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
-        'name', 'author', 'cooking_time', 'pub_date', 'favorite_count',
+        'name', 'author', 'cooking_time', 'pub_date', 'favorites_count',
+        'in_carts_count',
     )
     list_filter = ('author', 'tags',)
     search_fields = ('name', 'author__username',)
+    list_select_related = ('author',)
 
-    @admin.display(
-        description='Количетсво добавлений'
-    )
-    def favorite_count(self, obj):
-        return obj.favorites.count()
+    def delete_queryset(self, request, queryset):
+        delete_recipes(queryset.values_list('pk', flat=True))
 
 
 @admin.register(Tag)
@@ -47,3 +48,40 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
     search_fields = ('recipe__name', 'ingredient__name',)
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        ShoppingListItem.objects.change_recipe(
+            recipe_id, old_amounts, new_amounts
+        )
+        Recipe.objects.filter(pk=recipe_id).update(modified=timezone.now())
+
+    def save_model(self, request, obj, form, change):
+        old_amounts = {}
+        if change:
+            old = RecipeIngredient.objects.get(pk=obj.pk)
+            old_amounts = {old.ingredient_id: old.amount}
+            if old.recipe_id != obj.recipe_id:
+                self.change_recipe(old.recipe_id, old_amounts, {})
+                old_amounts = {}
+        super().save_model(request, obj, form, change)
+        self.change_recipe(
+            obj.recipe_id, old_amounts, {obj.ingredient_id: obj.amount}
+        )
+
+    def delete_model(self, request, obj):
+        self.change_recipe(obj.recipe_id, {obj.ingredient_id: obj.amount}, {})
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.change_recipe(
+                obj.recipe_id, {obj.ingredient_id: obj.amount}, {}
+            )
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount',)
+    search_fields = ('user__username', 'ingredient__name',)
+    readonly_fields = ('user', 'ingredient', 'amount',)
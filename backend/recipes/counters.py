@@ -0,0 +1,16 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарно изменяет счетчик field у объектов model с id из pks.
+
+    Значение не опускается ниже нуля, даже если счетчик разошелся
+    с данными; такие расхождения исправляет counters_reconcile.
+    """
+    pks = list(pks)
+    if not pks or not delta:
+        return
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
@@ -0,0 +1,106 @@
+from copy import copy
+from heapq import merge
+from itertools import islice
+
+from .models import Recipe, TimelineEntry
+from users.models import Subscription
+
+FEED_ORDERING = ('-pub_date', 'id')
+REVERSED_FEED_ORDERING = ('pub_date', '-id')
+TIMELINE_ORDERING = ('-pub_date', 'recipe_id')
+REVERSED_TIMELINE_ORDERING = ('pub_date', '-recipe_id')
+
+
+def row_key(row):
+    pub_date, recipe_id = row
+    return pub_date, -recipe_id
+
+
+class Feed:
+    """Лента подписок пользователя: рецепты от новых к старым.
+
+    Рецепты авторов с флагом User.feed_fanout читаются из ленты
+    TimelineEntry по индексу (user, -pub_date, recipe), рецепты
+    остальных авторов - из Recipe по индексу (author, -pub_date, id).
+    Из каждого источника берется не больше строк, чем нужно до конца
+    запрошенного среза, и строки сливаются в памяти.
+
+    Поддерживает ту часть API QuerySet, которой пользуются Paginator
+    и CursorPagination: count(), срезы, order_by() с порядком
+    FEED_ORDERING или обратным ему и filter() по pub_date.
+    """
+
+    ordered = True
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.reverse = False
+        self.lookups = {}
+        self.pull_authors = None
+
+    def get_pull_authors(self):
+        """Авторы из подписок, которые не рассылаются по лентам."""
+        if self.pull_authors is None:
+            self.pull_authors = list(
+                Subscription.objects.filter(
+                    user_id=self.user_id, author__feed_fanout=False
+                ).values_list('author_id', flat=True)
+            )
+        return self.pull_authors
+
+    def clone(self, **attrs):
+        self.get_pull_authors()
+        feed = copy(self)
+        feed.__dict__.update(attrs)
+        return feed
+
+    def order_by(self, *ordering):
+        if ordering == FEED_ORDERING:
+            return self.clone(reverse=False)
+        if ordering == REVERSED_FEED_ORDERING:
+            return self.clone(reverse=True)
+        raise ValueError(f'Unsupported feed ordering: {ordering}.')
+
+    def filter(self, **lookups):
+        return self.clone(lookups={**self.lookups, **lookups})
+
+    def sources(self):
+        sources = [
+            TimelineEntry.objects.filter(
+                user_id=self.user_id, **self.lookups
+            ).order_by(
+                *(REVERSED_TIMELINE_ORDERING if self.reverse
+                  else TIMELINE_ORDERING)
+            ).values_list('pub_date', 'recipe_id')
+        ]
+        if self.get_pull_authors():
+            sources.append(
+                Recipe.objects.filter(
+                    author_id__in=self.pull_authors, **self.lookups
+                ).order_by(
+                    *(REVERSED_FEED_ORDERING if self.reverse
+                      else FEED_ORDERING)
+                ).values_list('pub_date', 'id')
+            )
+        return sources
+
+    def count(self):
+        return sum(source.count() for source in self.sources())
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        rows = merge(
+            *(source[:stop] for source in self.sources()),
+            key=row_key,
+            reverse=not self.reverse,
+        )
+        recipe_ids = [
+            recipe_id for _, recipe_id in islice(rows, start, stop)
+        ]
+        recipes = Recipe.objects.select_related('author').in_bulk(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
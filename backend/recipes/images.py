@@ -0,0 +1,146 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR: str = 'recipes/variants'
+VARIANT_SIZES = {
+    'thumbnail': (480, 480),
+    'detail': (1200, 1200),
+}
+VARIANT_FORMAT: str = 'JPEG'
+VARIANT_EXTENSION: str = 'jpg'
+VARIANT_QUALITY: int = 80
+VARIANT_BACKGROUND = (255, 255, 255)
+
+image_executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-image',
+)
+
+
+def variant_name(name, variant):
+    """Имя файла варианта изображения в хранилище."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{VARIANT_EXTENSION}'
+
+
+def render_variant(image, size):
+    variant = ImageOps.exif_transpose(image)
+    variant.thumbnail(size)
+    if variant.mode in ('RGBA', 'LA', 'P'):
+        variant = variant.convert('RGBA')
+        background = Image.new('RGB', variant.size, VARIANT_BACKGROUND)
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    elif variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(
+        buffer,
+        VARIANT_FORMAT,
+        quality=VARIANT_QUALITY,
+        optimize=True,
+        progressive=True,
+    )
+    return buffer.getvalue()
+
+
+def mark_ready(names):
+    """Отмечает варианты изображений names готовыми во всех рецептах
+    с этими изображениями.
+
+    Рецепты, изображение которых успело смениться, не затрагиваются.
+    """
+    return Recipe.objects.filter(image__in=names).exclude(
+        variants_image=F('image')
+    ).update(variants_image=F('image'))
+
+
+def missing_variants(name):
+    """Словарь вариант -> размер для вариантов, которых нет в хранилище."""
+    return {
+        variant: size for variant, size in VARIANT_SIZES.items()
+        if not default_storage.exists(variant_name(name, variant))
+    }
+
+
+def generate_variants(name):
+    """Создает уменьшенные варианты изображения name.
+
+    Работает только с хранилищем файлов и не обращается к базе,
+    поэтому безопасно выполняется в фоновом потоке. Уже существующие
+    варианты не перезаписываются. Возвращает число созданных
+    вариантов.
+    """
+    missing = missing_variants(name)
+    if not missing:
+        return 0
+    with default_storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image.load()
+    for variant, size in missing.items():
+        default_storage.save(
+            variant_name(name, variant),
+            ContentFile(render_variant(image, size)),
+        )
+    return len(missing)
+
+
+def build_variants(name):
+    """Создает варианты изображения name в фоновом потоке и отмечает
+    их готовыми в рецептах. Соединение потока с базой закрывается.
+    """
+    try:
+        generate_variants(name)
+        mark_ready((name,))
+    finally:
+        connection.close()
+
+
+def log_variant_errors(name, future):
+    if future.exception() is not None:
+        logger.error(
+            'Failed to generate variants for %s', name,
+            exc_info=future.exception(),
+        )
+
+
+def schedule_variants(name):
+    """Ставит создание вариантов изображения в фоновый пул."""
+    future = image_executor.submit(build_variants, name)
+    future.add_done_callback(lambda done: log_variant_errors(name, done))
+    return future
+
+
+def get_variant_urls(recipe):
+    """Словарь вариант -> URL изображения рецепта; пока варианты
+    не готовы, отдается оригинал.
+    """
+    if not recipe.image:
+        return {variant: None for variant in VARIANT_SIZES}
+    return variant_urls(
+        recipe.image.name, recipe.image.url, recipe.variants_ready
+    )
+
+
+def variant_urls(name, original_url, ready):
+    """То же по имени файла и признаку готовности, без обращения
+    к полю модели и к хранилищу.
+    """
+    return {
+        variant: default_storage.url(variant_name(name, variant))
+        if ready else original_url
+        for variant in VARIANT_SIZES
+    }
@@ -0,0 +1,87 @@
+from bisect import bisect_left
+from threading import Lock
+
+from .models import Ingredient, ModelVersion
+
+MAX_RESULTS: int = 50
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный по имени в нижнем регистре список
+    ингредиентов. Префиксные совпадения ищутся бинарным поиском,
+    совпадения по подстроке - проходом по списку. Индекс
+    перестраивается, когда меняется версия модели Ingredient,
+    поэтому сброс в одном процессе видят все остальные.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = ([], [])
+        self._version = None
+
+    def _build(self):
+        """Строит ключи и строки заново и публикует их одним
+        присваиванием, чтобы search без блокировки не увидел
+        ключи одной версии со строками другой.
+        """
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id']),
+        )
+        keys = [row['name'].casefold() for row in rows]
+        self._entries = (keys, rows)
+
+    def _ensure_fresh(self):
+        label = Ingredient._meta.label_lower
+        version = ModelVersion.get_many(label)[label][0]
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                self._build()
+                self._version = version
+
+    def invalidate(self):
+        """Сбрасывает индекс во всех процессах."""
+        ModelVersion.bump(Ingredient._meta.label_lower)
+        self._version = None
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Ищет ингредиенты без учета регистра.
+
+        Сначала идут точные совпадения, затем совпадения по префиксу,
+        затем по подстроке; результат ограничен limit элементами.
+        """
+        self._ensure_fresh()
+        query = query.strip().casefold()
+        keys, rows = self._entries
+        if not query:
+            return rows[:limit]
+        start = bisect_left(keys, query)
+        position = start
+        exact, prefix = [], []
+        while (
+            position < len(keys)
+            and keys[position].startswith(query)
+            and len(exact) + len(prefix) < limit
+        ):
+            if keys[position] == query:
+                exact.append(rows[position])
+            else:
+                prefix.append(rows[position])
+            position += 1
+        result = exact + prefix
+        if len(result) < limit:
+            for index, key in enumerate(keys):
+                if start <= index < position:
+                    continue
+                if query in key:
+                    result.append(rows[index])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
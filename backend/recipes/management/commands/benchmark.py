@@ -0,0 +1,225 @@
+import json
+import platform
+from time import perf_counter
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+REQUESTS: int = 50
+WARMUP: int = 3
+PERCENTILES = (50, 95, 99)
+TIMEOUT: int = 30
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, -(-rank * len(ordered) // 100) - 1)
+    return ordered[index]
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Django в этом же процессе."""
+
+    name = 'client'
+
+    def __init__(self):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if '*' not in host),
+            'localhost',
+        )
+        self.client = Client(HTTP_HOST=host)
+
+    def get(self, path, token):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = self.client.get(path, **headers)
+            body = b''.join(response) if response.streaming else (
+                response.content
+            )
+            elapsed = perf_counter() - started
+        return response.status_code, elapsed, len(queries), len(body)
+
+
+class ServerTransport:
+    """Запросы к запущенному серверу; число запросов к базе неизвестно."""
+
+    name = 'server'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def get(self, path, token):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        started = perf_counter()
+        response = self.session.get(
+            f'{self.base_url}{path}', headers=headers, timeout=TIMEOUT
+        )
+        elapsed = perf_counter() - started
+        return response.status_code, elapsed, None, len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку основных эндпоинтов API: p50/p95/p99, '
+        'число запросов к базе и размер ответа. Результат сохраняется '
+        'в JSON для сравнения запусков.'
+    )
+
+    def get_endpoints(self):
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        tag = Tag.objects.first()
+        if recipe is None or tag is None:
+            raise CommandError('No recipes or tags, run seed_data first.')
+        return {
+            'recipes_list_anonymous': ('/api/recipes/', False),
+            'recipes_list': ('/api/recipes/', True),
+            'recipes_cursor': ('/api/recipes/?cursor=', True),
+            'recipes_by_tag': (
+                f'/api/recipes/?{urlencode({"tags": tag.slug})}', True
+            ),
+            'recipes_search': (
+                f'/api/recipes/?{urlencode({"search": recipe.name})}', True
+            ),
+            'recipes_favorited': ('/api/recipes/?is_favorited=1', True),
+            'recipes_feed': ('/api/recipes/feed/', True),
+            'recipe_detail': (f'/api/recipes/{recipe.id}/', True),
+            'recipe_similar': (f'/api/recipes/{recipe.id}/similar/', True),
+            'tags': ('/api/tags/', False),
+            'ingredients_search': (
+                f'/api/ingredients/?{urlencode({"name": "ин"})}', False
+            ),
+            'users': ('/api/users/', True),
+            'users_me': ('/api/users/me/', True),
+            'subscriptions': ('/api/users/subscriptions/', True),
+            'shopping_list': (
+                '/api/recipes/download_shopping_cart/', True
+            ),
+        }
+
+    def get_user(self, email):
+        users = User.objects.filter(is_active=True)
+        if email:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(shopping_cart__isnull=False).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError('No suitable user found.')
+        return user
+
+    def measure(self, transport, path, token, count, warmup):
+        for _ in range(warmup):
+            transport.get(path, token)
+        timings, queries, sizes, statuses = [], [], [], set()
+        for _ in range(count):
+            status, elapsed, query_count, size = transport.get(path, token)
+            statuses.add(status)
+            timings.append(elapsed * 1000)
+            queries.append(query_count)
+            sizes.append(size)
+        result = {
+            'path': path,
+            'statuses': sorted(statuses),
+            'requests': count,
+            'mean_ms': round(sum(timings) / count, 3),
+            'bytes': max(sizes),
+            'queries': None if None in queries else max(queries),
+        }
+        for rank in PERCENTILES:
+            result[f'p{rank}_ms'] = round(percentile(timings, rank), 3)
+        return result
+
+    def write_row(self, name, result, previous=None):
+        line = (
+            f'{name:<24} p50 {result["p50_ms"]:>8.2f} '
+            f'p95 {result["p95_ms"]:>8.2f} p99 {result["p99_ms"]:>8.2f} ms  '
+            f'queries {result["queries"]!s:>4}  bytes {result["bytes"]:>8}'
+        )
+        if previous is not None:
+            change = result['p95_ms'] - previous['p95_ms']
+            line += f'  p95 {change:+.2f} ms'
+        if result['statuses'] != [200]:
+            line += f'  statuses {result["statuses"]}'
+        self.stdout.write(line)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=REQUESTS,
+            help='Число замеряемых запросов к каждому эндпоинту.',
+        )
+        parser.add_argument('--warmup', type=int, default=WARMUP)
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера; без него используется '
+                 'тестовый клиент Django.',
+        )
+        parser.add_argument(
+            '--user', help='Почта пользователя для авторизованных запросов.'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Замерять только указанные эндпоинты.',
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого запуска для сравнения.'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+        user = self.get_user(options['user'])
+        token = Token.objects.get_or_create(user=user)[0].key
+        endpoints = self.get_endpoints()
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - endpoints.keys()
+            if unknown:
+                raise CommandError(
+                    f'Unknown endpoints: {", ".join(sorted(unknown))}.'
+                )
+            endpoints = {
+                name: endpoints[name] for name in options['endpoints']
+            }
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        transport = (
+            ServerTransport(options['url']) if options['url']
+            else ClientTransport()
+        )
+        results = {}
+        for name, (path, authenticated) in endpoints.items():
+            results[name] = self.measure(
+                transport, path, token if authenticated else None,
+                options['requests'], options['warmup'],
+            )
+            self.write_row(name, results[name], previous.get(name))
+        report = {
+            'created': timezone.now().isoformat(),
+            'transport': transport.name,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'user_id': user.id,
+            'recipes': Recipe.objects.count(),
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Results saved to {options["output"]}.'
+            ))
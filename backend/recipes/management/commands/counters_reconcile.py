@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def expected_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счетчики рецептов '
+        'и пользователей или проверяет их на расхождения (--check).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        drifted = 0
+        for model, counter, related_model, related_field in COUNTERS:
+            expected = expected_count(related_model, related_field)
+            wrong = model.objects.annotate(expected=expected).exclude(
+                **{counter: F('expected')}
+            )
+            count = wrong.count()
+            drifted += count
+            self.stdout.write(
+                f'{model._meta.label}.{counter}: {count} drifted rows.'
+            )
+            if count and not options['check']:
+                model.objects.filter(
+                    pk__in=wrong.values('pk')
+                ).update(**{counter: expected})
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Counters are consistent.'))
+        elif options['check']:
+            raise CommandError(f'Found {drifted} drifted counters.')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Repaired {drifted} drifted counters.'
+            ))
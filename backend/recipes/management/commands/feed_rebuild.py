@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FEED_BATCH_SIZE, TimelineEntry
+from users.models import Subscription, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает, какие авторы рассылаются по лентам, и пересобирает '
+        'ленты подписок: последние FEED_BACKFILL_RECIPES рецептов '
+        'таких авторов для каждого их подписчика, как при подписке.'
+    )
+
+    def update_flags(self):
+        threshold = settings.FEED_FANOUT_FOLLOWERS
+        User.objects.filter(followers_count__gt=threshold).update(
+            feed_fanout=False
+        )
+        User.objects.filter(followers_count__lte=threshold).update(
+            feed_fanout=True
+        )
+
+    def get_authors(self):
+        return Subscription.objects.filter(
+            author__feed_fanout=True
+        ).order_by('author_id').values_list('author_id', flat=True).distinct()
+
+    @transaction.atomic
+    def rebuild(self):
+        self.update_flags()
+        TimelineEntry.objects.all().delete()
+        authors = list(self.get_authors())
+        for start in range(0, len(authors), FEED_BATCH_SIZE):
+            TimelineEntry.objects.backfill_followers(
+                authors[start:start + FEED_BATCH_SIZE]
+            )
+        return TimelineEntry.objects.count()
+
+    def handle(self, *args, **options):
+        count = self.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Feeds rebuilt: {count} entries.'
+        ))
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.images import generate_variants, mark_ready, missing_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает недостающие варианты изображений рецептов и отмечает '
+        'их готовыми или только проверяет их наличие (--check).'
+    )
+
+    def get_images(self):
+        return sorted(set(
+            Recipe.objects.exclude(image='').values_list('image', flat=True)
+        ))
+
+    def generate(self, name):
+        try:
+            return generate_variants(name), None
+        except Exception as error:
+            return 0, error
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить наличие вариантов, не создавая их.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RECIPE_IMAGE_WORKERS,
+            help='Число потоков обработки изображений.',
+        )
+
+    def handle(self, *args, **options):
+        images = self.get_images()
+        if options['check']:
+            missing = [name for name in images if missing_variants(name)]
+            for name in missing[:20]:
+                self.stdout.write(name)
+            if missing:
+                raise CommandError(
+                    f'Found {len(missing)} images without variants.'
+                )
+            self.stdout.write(self.style.SUCCESS('All variants exist.'))
+            return
+        created = failed = 0
+        ready = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for name, (count, error) in zip(
+                images, executor.map(self.generate, images)
+            ):
+                created += count
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                else:
+                    ready.append(name)
+        mark_ready(ready)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} variants for {len(images)} images, '
+            f'{failed} failed.'
+        ))
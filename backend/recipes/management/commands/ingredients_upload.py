@@ -1,41 +1,153 @@
 import csv
+import io
 import json
 import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
-from django.db.utils import IntegrityError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
+BATCH_SIZE: int = 1000
+JSON_CHUNK_SIZE: int = 64 * 1024
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) == 2:
+            yield {'name': row[0], 'measurement_unit': row[1]}
+        else:
+            yield None
+
+
+def iter_json(file):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON file must contain an array.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Unexpected end of JSON file.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield row
+
+
+def clean_rows(rows):
+    for row in rows:
+        if not isinstance(row, dict):
+            yield None
+            continue
+        name = str(row.get('name') or '').strip()
+        measurement_unit = str(row.get('measurement_unit') or '').strip()
+        if not name or not measurement_unit:
+            yield None
+            continue
+        yield name, measurement_unit
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON пакетами. '
+        'Уже существующие ингредиенты пропускаются.'
+    )
 
-    def upload_to_db(self, path_to_file):
-        with open(path_to_file, encoding='utf-8', mode='r') as file:
-            data_for_db = []
-            if path_to_file[-4:] == '.csv':
-                reader = csv.reader(file)
-                for name, measurement_unit in reader:
-                    data_for_db.append(
-                        {
-                            'name': name,
-                            'measurement_unit': measurement_unit,
-                        }
-                    )
-            elif path_to_file[-5:] == '.json':
-                data_for_db = json.load(file)
-
-            try:
-                for row_for_db in data_for_db:
-                    Ingredient.objects.create(**row_for_db)
-                self.stdout.write(f'{path_to_file} is uploaded.')
-            except IntegrityError as e:
-                self.stdout.write(
-                    f'in {path_to_file} | {str(e)} | {row_for_db}'
+    def bulk_insert(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def copy_insert(self, batches):
+        """Загрузка через COPY во временную таблицу (только PostgreSQL)."""
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredients_upload '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batches:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredients_upload FROM STDIN WITH (FORMAT csv)',
+                    buffer,
                 )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredients_upload '
+                'ON CONFLICT ON CONSTRAINT unique_ingredients DO NOTHING'
+            )
+
+    def upload_to_db(self, path_to_file, batch_size, use_copy):
+        counts = {'total': 0, 'invalid': 0}
+
+        def valid_rows(rows):
+            for row in clean_rows(rows):
+                counts['total'] += 1
+                if row is None:
+                    counts['invalid'] += 1
+                    continue
+                yield row
+
+        with open(path_to_file, encoding='utf-8', mode='r') as file:
+            if path_to_file.endswith('.csv'):
+                rows = iter_csv(file)
+            elif path_to_file.endswith('.json'):
+                rows = iter_json(file)
+            else:
+                raise CommandError('Only .csv and .json files are supported.')
+            with transaction.atomic():
+                before = Ingredient.objects.count()
+                row_batches = batches(valid_rows(rows), batch_size)
+                if use_copy:
+                    self.copy_insert(row_batches)
+                else:
+                    for batch in row_batches:
+                        self.bulk_insert(batch)
+                inserted = Ingredient.objects.count() - before
+        return inserted, counts['total'] - inserted, counts['invalid']
 
     def add_arguments(self, parser):
         parser.add_argument('directory', type=str, help='/path/to/file')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество строк в одном INSERT.',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Использовать COPY (только PostgreSQL).',
+        )
 
     def handle(self, *args, **options):
         directory = options['directory']
@@ -45,5 +157,25 @@ class Command(BaseCommand):
                 f'Directory "{directory}" does not exist.')
             )
             return
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        use_copy = options['copy']
+        if use_copy and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                'COPY is only available on PostgreSQL, using bulk insert.'
+            ))
+            use_copy = False
 
-        self.upload_to_db(directory)
+        started = time.perf_counter()
+        inserted, skipped, invalid = self.upload_to_db(
+            directory, options['batch_size'], use_copy
+        )
+        elapsed = time.perf_counter() - started
+        ingredient_index.invalidate()
+        total = inserted + skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'{directory} is uploaded: {inserted} inserted, '
+            f'{skipped} skipped ({invalid} invalid), '
+            f'{total / elapsed if elapsed else total:.0f} rows/s '
+            f'in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANT_SIZES, VARIANTS_DIR, variant_name
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+IMAGES_DIR: str = Recipe._meta.get_field('image').upload_to
+MIN_AGE_SECONDS: int = 60 * 60
+
+
+def walk(storage, directory):
+    """Рекурсивно перечисляет файлы каталога хранилища."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет изображения рецептов и их варианты, '
+        'на которые не ссылается ни один рецепт.'
+    )
+
+    def get_referenced(self):
+        images = set(
+            Recipe.objects.exclude(image='').values_list('image', flat=True)
+        )
+        variants = {
+            variant_name(image, variant)
+            for image in images for variant in VARIANT_SIZES
+        }
+        return images, variants
+
+    def find_orphans(self, storage, directory, referenced, min_age):
+        threshold = timezone.now() - timedelta(seconds=min_age)
+        for name in walk(storage, directory):
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name) > threshold:
+                continue
+            yield name
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=MIN_AGE_SECONDS,
+            help='Не трогать файлы моложе этого числа секунд.',
+        )
+
+    def handle(self, *args, **options):
+        images, variants = self.get_referenced()
+        orphans = [
+            (recipe_image_storage, name) for name in self.find_orphans(
+                recipe_image_storage, IMAGES_DIR, images, options['min_age']
+            )
+        ] + [
+            (default_storage, name) for name in self.find_orphans(
+                default_storage, VARIANTS_DIR, variants, options['min_age']
+            )
+        ]
+        freed = 0
+        for storage, name in orphans:
+            freed += storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {len(orphans)} orphaned files, '
+            f'{freed / 1024 / 1024:.1f} MiB.'
+        ))
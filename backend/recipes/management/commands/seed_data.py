@@ -0,0 +1,222 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.images import generate_variants
+from recipes.models import (Favorite, Ingredient, ModelVersion, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.services import delete_users
+from recipes.signals import VERSIONED_MODELS
+from recipes.storage import recipe_image_storage
+from users.models import Subscription, User
+
+BATCH_SIZE: int = 1000
+DEFAULT_PASSWORD: str = 'benchmark-password'
+IMAGE_SIZE = (640, 480)
+WORDS = (
+    'томатный', 'сливочный', 'острый', 'домашний', 'летний', 'пряный',
+    'суп', 'салат', 'пирог', 'соус', 'рагу', 'омлет', 'каша', 'паста',
+    'с курицей', 'с грибами', 'с сыром', 'с овощами', 'с рыбой',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'избранным, корзинами и подписками для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Общее число рецептов.',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=500,
+            help='Минимальный размер справочника ингредиентов.',
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+        )
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у каждого пользователя.',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине у каждого пользователя.',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок у каждого пользователя.',
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс логинов синтетических пользователей.',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить ранее созданных пользователей с этим префиксом.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+    def create_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', IMAGE_SIZE, (200, 120, 60)).save(buffer, 'JPEG')
+        name = recipe_image_storage.save(
+            f'{Recipe._meta.get_field("image").upload_to}/seed.jpg',
+            ContentFile(buffer.getvalue()),
+        )
+        generate_variants(name)
+        return name
+
+    def create_users(self, count, prefix):
+        password = make_password(DEFAULT_PASSWORD)
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            )
+            for number in range(count)
+        ))
+        return list(
+            User.objects.filter(username__startswith=prefix).values_list(
+                'id', flat=True
+            )
+        )
+
+    def create_tags(self, count):
+        existing = Tag.objects.count()
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'Тег {number}',
+                slug=f'tag-{number}',
+                color=f'#{number:06x}',
+            )
+            for number in range(existing, count)
+        ))
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_ingredients(self, count):
+        existing = Ingredient.objects.count()
+        self.bulk_create(Ingredient, (
+            Ingredient(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(existing, count)
+        ))
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_recipes(self, rng, options, user_ids, image):
+        self.bulk_create(Recipe, (
+            Recipe(
+                name=' '.join(rng.sample(WORDS, 3)),
+                text=' '.join(rng.choices(WORDS, k=30)),
+                cooking_time=rng.randint(5, 180),
+                author_id=rng.choice(user_ids),
+                image=image,
+                variants_image=image,
+            )
+            for _ in range(options['recipes'])
+        ))
+        return list(
+            Recipe.objects.filter(author_id__in=user_ids).values_list(
+                'id', flat=True
+            )
+        )
+
+    def create_relations(self, rng, model, field, user_ids, target_ids, k):
+        k = min(k, len(target_ids))
+        self.bulk_create(model, (
+            model(user_id=user_id, **{f'{field}_id': target_id})
+            for user_id in user_ids
+            for target_id in rng.sample(target_ids, k)
+            if target_id != user_id or model is not Subscription
+        ))
+
+    @transaction.atomic
+    def seed(self, rng, options):
+        prefix = options['prefix']
+        user_ids = self.create_users(options['users'], prefix)
+        tag_ids = self.create_tags(options['tags'])
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        recipe_ids = self.create_recipes(
+            rng, options, user_ids, self.create_image()
+        )
+        per_recipe = min(
+            options['ingredients_per_recipe'], len(ingredient_ids)
+        )
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+        ))
+        through = Recipe.tags.through
+        self.bulk_create(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(
+                tag_ids, rng.randint(1, min(3, len(tag_ids)))
+            )
+        ))
+        self.create_relations(
+            rng, Favorite, 'recipe', user_ids, recipe_ids,
+            options['favorites'],
+        )
+        self.create_relations(
+            rng, ShoppingCart, 'recipe', user_ids, recipe_ids,
+            options['cart'],
+        )
+        self.create_relations(
+            rng, Subscription, 'author', user_ids, user_ids,
+            options['subscriptions'],
+        )
+        return len(user_ids), len(recipe_ids)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        seeded = User.objects.filter(username__startswith=prefix)
+        if options['clear']:
+            delete_users(seeded.values_list('pk', flat=True))
+        elif seeded.exists():
+            raise CommandError(
+                f'Users with prefix "{prefix}" already exist, '
+                'use --clear or another --prefix.'
+            )
+        if not options['tags'] or not options['users']:
+            raise CommandError('At least one user and one tag are required.')
+        rng = random.Random(options['seed'])
+        users, recipes = self.seed(rng, options)
+        ModelVersion.bump(
+            *(model._meta.label_lower for model in VERSIONED_MODELS)
+        )
+        for command in (
+            'counters_reconcile', 'shopping_list_rebuild',
+            'feed_rebuild',
+        ):
+            call_command(command, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {users} users and {recipes} recipes.'
+        ))
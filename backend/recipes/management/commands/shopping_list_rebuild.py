@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from users.models import User
+
+BATCH_SIZE: int = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает агрегированные списки покупок из корзин '
+        'или проверяет их на расхождения (--check).'
+    )
+
+    def get_expected(self):
+        return {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total']
+            for row in RecipeIngredient.objects.filter(
+                recipe__shopping_cart__isnull=False
+            ).values(
+                'recipe__shopping_cart__user', 'ingredient'
+            ).annotate(total=Sum('amount')).order_by()
+        }
+
+    def get_actual(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+
+    def check_drift(self, expected):
+        actual = self.get_actual()
+        drift = [
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        ]
+        for user_id, ingredient_id in sorted(drift)[:20]:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'expected {expected.get((user_id, ingredient_id))}, '
+                f'actual {actual.get((user_id, ingredient_id))}'
+            )
+        return drift
+
+    @transaction.atomic
+    def rebuild(self):
+        """Пересобирает списки под блокировкой пользователей с корзинами
+        и списками покупок, взятой в том же порядке, что и в
+        ShoppingListItem.objects.apply_deltas: корзины не меняются
+        между чтением и записью.
+        """
+        ShoppingListItem.objects.lock_users(
+            User.objects.filter(
+                Q(pk__in=ShoppingCart.objects.values('user_id'))
+                | Q(pk__in=ShoppingListItem.objects.values('user_id'))
+            )
+        )
+        expected = self.get_expected()
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for (user_id, ingredient_id), amount in expected.items()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return len(expected)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = self.check_drift(self.get_expected())
+            if drift:
+                raise CommandError(f'Found {len(drift)} drifted rows.')
+            self.stdout.write(self.style.SUCCESS('No drift found.'))
+            return
+        count = self.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping lists rebuilt: {count} rows.'
+        ))
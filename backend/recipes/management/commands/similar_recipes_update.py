@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from recipes.models import Recipe, SimilarRecipe
+from recipes.similarity import TOP_K, RecipeMatrix
+
+BATCH_SIZE: int = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Рассчитывает похожие рецепты. По умолчанию пересчитывает '
+        'только рецепты, измененные после прошлого запуска, и рецепты, '
+        'чьи списки похожих от них или от удаленных рецептов зависят.'
+    )
+
+    def get_affected(self, matrix, changed, top):
+        """Рецепты, на списки похожих которых влияют изменения: в списке
+        есть измененный или удаленный рецепт или измененный рецепт
+        теперь проходит в список.
+        """
+        affected = set(
+            SimilarRecipe.objects.filter(
+                Q(similar_id__in=changed) | Q(similar__isnull=True)
+            ).values_list('recipe_id', flat=True)
+        )
+        thresholds = {
+            recipe_id: lowest if total >= top else 0
+            for recipe_id, lowest, total
+            in SimilarRecipe.objects.values('recipe_id').annotate(
+                lowest=Min('score'), total=Count('pk')
+            ).values_list('recipe_id', 'lowest', 'total').order_by()
+        }
+        for recipe_id in changed:
+            scores = matrix.scores(matrix.positions[recipe_id])
+            for index in scores.nonzero()[0]:
+                other_id = int(matrix.recipe_ids[index])
+                if scores[index] > thresholds.get(other_id, 0):
+                    affected.add(other_id)
+        return affected - changed
+
+    def get_targets(self, matrix, full, top):
+        since = SimilarRecipe.objects.aggregate(
+            computed=Max('computed')
+        )['computed']
+        if full or since is None:
+            return set(matrix.positions)
+        changed = set(
+            Recipe.objects.filter(modified__gte=since).values_list(
+                'id', flat=True
+            )
+        ) & matrix.positions.keys()
+        return changed | self.get_affected(matrix, changed, top)
+
+    @transaction.atomic
+    def save(self, matrix, targets, top, computed):
+        SimilarRecipe.objects.filter(recipe_id__in=targets).delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=recipe_id,
+                    similar_id=similar_id,
+                    score=score,
+                    computed=computed,
+                )
+                for recipe_id in targets
+                for similar_id, score in matrix.neighbors(recipe_id, top)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты.',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=TOP_K,
+            help='Сколько похожих рецептов хранить для каждого.',
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        matrix = RecipeMatrix.build()
+        targets = self.get_targets(matrix, options['full'], options['top'])
+        self.save(matrix, targets, options['top'], started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Similar recipes updated for {len(targets)} of '
+            f'{len(matrix.recipe_ids)} recipes '
+            f'in {(timezone.now() - started).total_seconds():.2f}s.'
+        ))
@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import EmptyResultSet
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, F, OuterRef, Q, Subquery, Value,
+                              When, Window)
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from .search import search_recipes
+from .storage import recipe_image_storage
+from users.models import Subscription
 
 User = get_user_model()
 
 MIN_AMOUNT_VALUE: int = 1
 HEX_LENGTH: int = 7
 LONG_LENGTH: int = 200
+FEED_BATCH_SIZE: int = 1000
 
 
 class BaseNameModel(models.Model):
@@ -63,14 +74,84 @@ class Ingredient(BaseNameModel):
         ]
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов для выдачи через API."""
+
+    def search(self, query):
+        """Полнотекстовый поиск с аннотацией релевантности search_rank."""
+        return search_recipes(self, query)
+
+    def with_ingredients(self, ingredient_ids):
+        """Рецепты хотя бы с одним из ингредиентов.
+
+        Число совпавших ингредиентов аннотируется в ingredients_coverage
+        подзапросом к RecipeIngredient, который выполняется только для
+        отобранных рецептов.
+        """
+        matches = RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids
+        )
+        coverage = matches.filter(recipe_id=OuterRef('pk')).order_by(
+        ).values('recipe_id').annotate(count=Count('pk')).values('count')
+        return self.filter(pk__in=matches.values('recipe_id')).annotate(
+            ingredients_coverage=Subquery(
+                coverage, output_field=models.IntegerField()
+            )
+        )
+
+    def without_ingredients(self, ingredient_ids):
+        """Исключает рецепты, содержащие любой из ингредиентов."""
+        return self.exclude(
+            pk__in=RecipeIngredient.objects.filter(
+                ingredient_id__in=ingredient_ids
+            ).values('recipe_id')
+        )
+
+    def latest_by_author(self, limit, *fields):
+        """Строки fields не больше чем limit последних рецептов
+        каждого автора.
+
+        Рецепты нумеруются ROW_NUMBER() в окне автора, лишние
+        отсекаются в базе одним запросом. Строки возвращаются
+        кортежами без преобразования типов, по возрастанию номера.
+        """
+        ranked = self.annotate(
+            author_rank=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').asc()),
+            )
+        ).order_by().values_list(*fields, 'author_rank')
+        try:
+            sql, params = ranked.query.sql_with_params()
+        except EmptyResultSet:
+            return []
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE author_rank <= %s ORDER BY author_rank',
+                (*params, limit),
+            )
+            return [row[:-1] for row in cursor.fetchall()]
+
+
 class Recipe(BaseNameModel):
     """Модель рецептов."""
 
     pub_date = models.DateTimeField(
         'Дата добавления', auto_now_add=True
     )
+    modified = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True
+    )
     image = models.ImageField(
-        'Фото', upload_to='recipes/images'
+        'Фото', upload_to='recipes/images', storage=recipe_image_storage
+    )
+    variants_image = models.CharField(
+        'Изображение с готовыми вариантами',
+        max_length=100,
+        blank=True,
+        editable=False,
     )
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
@@ -94,14 +175,42 @@ class Recipe(BaseNameModel):
         related_name='recipes_list',
         verbose_name='Ингредиенты'
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в корзину', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.name
 
+    @property
+    def variants_ready(self):
+        """Созданы ли уменьшенные варианты текущего изображения."""
+        return bool(self.image) and self.variants_image == self.image.name
+
+    def delete(self, using=None, keep_parents=False):
+        """Удаляет рецепт пакетно, см. services.delete_recipes."""
+        from .services import delete_recipes
+        return delete_recipes((self.pk,))
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-favorites_count', '-pub_date'),
+                name='recipe_popularity',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', 'id'),
+                name='recipe_author_date',
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -196,3 +305,451 @@ class ShoppingCart(models.Model):
                 name='unique_user_recipe'
             )
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """QuerySet агрегированного списка покупок."""
+
+    def lock_users(self, user_ids):
+        """Блокирует строки пользователей в порядке id до конца
+        транзакции, чтобы изменения их списков покупок шли по очереди.
+        """
+        return list(
+            User.objects.select_for_update().filter(
+                pk__in=user_ids
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+
+    @transaction.atomic
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавляет deltas (ingredient_id -> изменение количества)
+        к спискам покупок пользователей user_ids.
+
+        Списки пользователей изменяются под блокировкой их строк,
+        количество не опускается ниже нуля, а строки, в которых
+        оно стало нулевым, удаляются.
+        """
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not deltas:
+            return
+        user_ids = self.lock_users(user_ids)
+        if not user_ids:
+            return
+        increase = [
+            ingredient_id
+            for ingredient_id, delta in deltas.items() if delta > 0
+        ]
+        decrease = [
+            ingredient_id
+            for ingredient_id, delta in deltas.items() if delta < 0
+        ]
+        if increase:
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=0,
+                    )
+                    for user_id in user_ids for ingredient_id in increase
+                ],
+                ignore_conflicts=True,
+            )
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        items.update(amount=Greatest(F('amount') + amount_case(deltas), 0))
+        if decrease:
+            items.filter(ingredient_id__in=decrease, amount=0).delete()
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты
+        рецептов из списка покупок пользователя.
+        """
+        deltas = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'amount'):
+            deltas[ingredient_id] = (
+                deltas.get(ingredient_id, 0) + sign * amount
+            )
+        self.apply_deltas((user_id,), deltas)
+
+    def remove_recipes(self, recipe_ids):
+        """Вычитает рецепты из списков покупок всех пользователей,
+        у которых они в корзине.
+
+        Пользователи с одинаковым набором таких рецептов
+        обновляются вместе.
+        """
+        carts = {}
+        for user_id, recipe_id in ShoppingCart.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('user_id', 'recipe_id'):
+            carts.setdefault(user_id, set()).add(recipe_id)
+        if not carts:
+            return
+        groups = {}
+        for user_id, cart in carts.items():
+            groups.setdefault(frozenset(cart), []).append(user_id)
+        amounts = {}
+        for recipe_id, ingredient_id, amount in (
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'ingredient_id', 'amount')
+        ):
+            amounts.setdefault(recipe_id, []).append((ingredient_id, amount))
+        for cart, user_ids in groups.items():
+            deltas = {}
+            for recipe_id in cart:
+                for ingredient_id, amount in amounts.get(recipe_id, ()):
+                    deltas[ingredient_id] = (
+                        deltas.get(ingredient_id, 0) - amount
+                    )
+            self.apply_deltas(user_ids, deltas)
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Переносит изменение ингредиентов рецепта в списки покупок
+        всех пользователей, у которых рецепт в корзине.
+        """
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        if not any(deltas.values()):
+            return
+        self.apply_deltas(
+            ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+                'user_id', flat=True
+            ),
+            deltas,
+        )
+
+
+def amount_case(amounts):
+    return Case(
+        *(When(ingredient_id=ingredient_id, then=Value(amount))
+          for ingredient_id, amount in amounts.items()),
+        default=Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя.
+
+    Поддерживается при добавлении и удалении рецептов из корзины
+    и при изменении ингредиентов рецептов в корзине.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} в списке покупок у {self.user}'
+
+    class Meta:
+        verbose_name = 'Список покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_ingredient'
+            )
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Рецепт, похожий на данный по ингредиентам и тегам.
+
+    Заполняется командой similar_recipes_update. При удалении похожего
+    рецепта строка остается с пустым similar, чтобы следующий запуск
+    команды пересчитал список.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Близость')
+    computed = models.DateTimeField('Дата расчета')
+
+    def __str__(self) -> str:
+        return f'{self.similar} похож на {self.recipe}'
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            )
+        ]
+
+
+def is_fanout_author(author_id):
+    """Рассылаются ли рецепты автора по лентам подписчиков.
+
+    Строка автора блокируется до конца транзакции, чтобы рассылка
+    не пересеклась с переключением автора в update_fanout.
+    """
+    return User.objects.select_for_update().filter(
+        pk=author_id, feed_fanout=True
+    ).exists()
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    """QuerySet лент подписок."""
+
+    def create_entries(self, rows):
+        """Создает записи из кортежей (user_id, recipe_id, author_id,
+        pub_date), пропуская уже существующие.
+        """
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id, recipe_id, author_id, pub_date in rows
+            ),
+            batch_size=FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def recent_recipes(self, author_ids):
+        """Последние FEED_BACKFILL_RECIPES рецептов каждого из авторов,
+        которые рассылаются по лентам.
+        """
+        recipe_ids = [
+            recipe_id for recipe_id, in Recipe.objects.filter(
+                author_id__in=author_ids, author__feed_fanout=True
+            ).latest_by_author(settings.FEED_BACKFILL_RECIPES, 'id')
+        ]
+        return Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            'id', 'author_id', 'pub_date'
+        )
+
+    @transaction.atomic
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        if not is_fanout_author(recipe.author_id):
+            return
+        self.create_entries(
+            (user_id, recipe.pk, recipe.author_id, recipe.pub_date)
+            for user_id in Subscription.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        )
+
+    def backfill(self, user_id, author_ids):
+        """Добавляет в ленту последние рецепты новых авторов."""
+        self.create_entries(
+            (user_id, recipe_id, author_id, pub_date)
+            for recipe_id, author_id, pub_date
+            in self.recent_recipes(author_ids)
+        )
+
+    def backfill_followers(self, author_ids):
+        """Добавляет последние рецепты авторов в ленты всех их
+        подписчиков.
+        """
+        recipes = {}
+        for recipe_id, author_id, pub_date in self.recent_recipes(
+            author_ids
+        ):
+            recipes.setdefault(author_id, []).append((recipe_id, pub_date))
+        self.create_entries(
+            (user_id, recipe_id, author_id, pub_date)
+            for user_id, author_id in Subscription.objects.filter(
+                author_id__in=recipes
+            ).values_list('user_id', 'author_id').iterator()
+            for recipe_id, pub_date in recipes[author_id]
+        )
+
+    def remove_authors(self, user_id, author_ids):
+        """Убирает из ленты рецепты авторов после отписки."""
+        self.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+    @transaction.atomic
+    def update_fanout(self, author_ids):
+        """Переключает авторов между рассылкой по лентам и чтением
+        их рецептов при выдаче ленты, когда число подписчиков уходит
+        за порог.
+
+        Автор перестает рассылаться, когда подписчиков становится
+        больше FEED_FANOUT_FOLLOWERS, и его записи убираются из лент.
+        Снова рассылаться он начинает, когда подписчиков не больше
+        половины порога, и его последние рецепты возвращаются в ленты.
+        Разрыв между порогами не дает переключать автора на каждой
+        подписке и отписке у границы.
+        """
+        threshold = settings.FEED_FANOUT_FOLLOWERS
+        switched = {True: [], False: []}
+        for author_id, fanout in User.objects.select_for_update().filter(
+            Q(feed_fanout=True, followers_count__gt=threshold)
+            | Q(feed_fanout=False, followers_count__lte=threshold // 2),
+            pk__in=author_ids,
+        ).order_by('pk').values_list('pk', 'feed_fanout'):
+            switched[not fanout].append(author_id)
+        if switched[False]:
+            User.objects.filter(pk__in=switched[False]).update(
+                feed_fanout=False
+            )
+            self.filter(author_id__in=switched[False]).delete()
+        if switched[True]:
+            User.objects.filter(pk__in=switched[True]).update(
+                feed_fanout=True
+            )
+            self.backfill_followers(switched[True])
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Заполняется при публикации рецепта (fan-out on write) и при
+    подписке, но только для авторов с флагом User.feed_fanout.
+    Рецепты остальных авторов подмешиваются при чтении, см.
+    recipes.feed.Feed. Флаг переключается при подписке и отписке,
+    когда число подписчиков уходит за порог (update_fanout);
+    после изменения FEED_FANOUT_FOLLOWERS флаги и ленты всех
+    авторов пересчитывает команда feed_rebuild.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id} в ленте {self.user_id}'
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', 'recipe'),
+                name='timeline_user_date',
+            ),
+            models.Index(fields=('author', 'user'), name='timeline_author'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            )
+        ]
+
+
+class ModelVersion(models.Model):
+    """Счетчик версий модели для валидаторов кеша.
+
+    Увеличивается при каждом сохранении или удалении объекта
+    отслеживаемой модели.
+    """
+
+    label = models.CharField(
+        'Модель', max_length=LONG_LENGTH, primary_key=True
+    )
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    modified = models.DateTimeField('Изменено', auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.label} v{self.version}'
+
+    @classmethod
+    def bump(cls, *labels):
+        """Увеличивает версии переданных моделей одним UPDATE;
+        отсутствующие версии создаются одним INSERT.
+        """
+        labels = set(labels)
+        if not labels:
+            return
+        updated = cls.objects.filter(label__in=labels).update(
+            version=F('version') + 1, modified=timezone.now()
+        )
+        if updated < len(labels):
+            existing = set(
+                cls.objects.filter(label__in=labels).values_list(
+                    'label', flat=True
+                )
+            )
+            cls.objects.bulk_create(
+                [cls(label=label, version=1) for label in labels - existing],
+                ignore_conflicts=True,
+            )
+
+    @classmethod
+    def get_many(cls, *labels):
+        """Возвращает словарь label -> (version, modified) одним запросом.
+
+        Для моделей, которые еще не менялись, возвращается (0, None).
+        """
+        versions = {label: (0, None) for label in labels}
+        versions.update(
+            (label, (version, modified))
+            for label, version, modified in cls.objects.filter(
+                label__in=labels
+            ).values_list('label', 'version', 'modified')
+        )
+        return versions
+
+    class Meta:
+        verbose_name = 'Версия модели'
+        verbose_name_plural = 'Версии моделей'
+
+
+USER_PROFILE_LABEL: str = 'users.profile'
+
+
+def user_state_label(user_id):
+    """Метка версии избранного, корзины и подписок пользователя."""
+    return f'users.state:{user_id}'
@@ -0,0 +1,155 @@
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG: str = 'russian'
+FTS_TABLE: str = 'recipes_recipe_fts'
+NAME_WEIGHT: float = 10.0
+TEXT_WEIGHT: float = 1.0
+MAX_SEARCH_TERMS: int = 10
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+fts_databases = set()
+
+PG_INSTALL_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector ON recipes_recipe '
+    'USING gin ((' + ' || '.join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+        f"COALESCE({column}, '')), '{weight}')"
+        for column, weight in (('name', 'A'), ('text', 'B'))
+    ) + '))',
+    'CREATE INDEX IF NOT EXISTS recipe_name_trigram ON recipes_recipe '
+    'USING gin (name gin_trgm_ops)',
+)
+
+SQLITE_INSTALL_SQL = (
+    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON recipes_recipe '
+    f'BEGIN INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON recipes_recipe '
+    f'BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name, text '
+    f'ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def has_fts5(cursor):
+    """Собран ли SQLite с модулем FTS5."""
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+    except OperationalError:
+        return False
+    cursor.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def has_fts_table(connection):
+    """Есть ли в базе SQLite таблица полнотекстового поиска.
+
+    Положительный ответ запоминается для базы, чтобы не обращаться
+    к sqlite_master при каждом поиске.
+    """
+    name = connection.settings_dict['NAME']
+    if name in fts_databases:
+        return True
+    if FTS_TABLE in connection.introspection.table_names():
+        fts_databases.add(name)
+        return True
+    return False
+
+
+def install_search(using='default', **kwargs):
+    """Создает индексы полнотекстового поиска для текущей СУБД.
+
+    Вызывается после migrate; повторный вызов ничего не меняет.
+    Если SQLite собран без FTS5, таблица поиска не создается
+    и search_recipes ищет по вхождению в название.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in PG_INSTALL_SQL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            if has_fts_table(connection) or not has_fts5(cursor):
+                return
+            for sql in SQLITE_INSTALL_SQL:
+                cursor.execute(sql)
+
+
+def search_terms(query):
+    return TERM_PATTERN.findall(query.casefold())[:MAX_SEARCH_TERMS]
+
+
+def search_postgres(queryset, text):
+    """Поиск по tsvector названия и описания или по похожести названия.
+
+    Выражения совпадают с индексами из PG_INSTALL_SQL.
+    """
+    from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                SearchVector,
+                                                TrigramSimilarity)
+    vector = (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.alias(search_document=vector).filter(
+        Q(search_document=query) | Q(name__trigram_similar=text)
+    ).annotate(
+        search_rank=SearchRank(F('search_document'), query)
+        + TrigramSimilarity('name', text)
+    )
+
+
+def search_sqlite(queryset, match):
+    """Поиск по таблице FTS5 с релевантностью bm25."""
+    table = queryset.model._meta.db_table
+    fts_query = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    return queryset.filter(
+        pk__in=RawSQL(fts_query, (match,))
+    ).annotate(
+        search_rank=RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+            (NAME_WEIGHT, TEXT_WEIGHT, match),
+            output_field=FloatField(),
+        )
+    )
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по запросу и аннотирует релевантность.
+
+    Релевантность доступна в поле search_rank: чем больше, тем выше.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).none()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return search_postgres(queryset, ' '.join(terms))
+    if connection.vendor == 'sqlite' and has_fts_table(connection):
+        return search_sqlite(
+            queryset, ' '.join(f'"{term}"*' for term in terms)
+        )
+    condition = Q()
+    for term in terms:
+        condition |= Q(name__icontains=term)
+    return queryset.filter(condition).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
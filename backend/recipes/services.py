@@ -0,0 +1,256 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+
+from .counters import change_counter
+from .models import (Favorite, ModelVersion, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, TimelineEntry,
+                     user_state_label)
+from .signals import COUNTERS, USER_STATE_MODELS, muted_signals
+from users.models import Subscription, User
+
+ADDED: str = 'added'
+ALREADY_ADDED: str = 'already_added'
+REMOVED: str = 'removed'
+NOT_ADDED: str = 'not_added'
+NOT_FOUND: str = 'not_found'
+SELF_SUBSCRIPTION: str = 'self_subscription'
+
+
+def unique_ids(ids):
+    return list(dict.fromkeys(ids))
+
+
+def changed_ids(outcomes, outcome):
+    return [
+        target_id for target_id, result in outcomes.items()
+        if result == outcome
+    ]
+
+
+def lock_users(model, user, target_ids):
+    """Блокирует до конца транзакции строки пользователя и, для
+    подписок, авторов target_ids, чтобы параллельные пакетные операции
+    над ними шли по очереди.
+
+    Строки блокируются одним запросом в порядке id: подписки A на B
+    и B на A, которые иначе взяли бы блокировки в разном порядке,
+    не приводят к взаимной блокировке.
+    """
+    user_ids = [user.pk]
+    if COUNTERS[model][0] is User:
+        user_ids.extend(target_ids)
+    list(
+        User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def after_relations_changed(model, user, target_ids, sign):
+    if model is ShoppingCart:
+        ShoppingListItem.objects.add_recipes(user.pk, target_ids, sign)
+    target_model, _, counter = COUNTERS[model]
+    change_counter(target_model, target_ids, counter, sign)
+    ModelVersion.bump(user_state_label(user.pk))
+
+
+def add_relations(model, user, target_field, target_model, ids, exclude=()):
+    """Создает связи пользователя с объектами ids одним INSERT.
+
+    Возвращает словарь id -> результат операции.
+    """
+    ids = unique_ids(ids)
+    with transaction.atomic():
+        lock_users(model, user, ids)
+        found = set(
+            target_model.objects.filter(id__in=ids).values_list(
+                'id', flat=True
+            )
+        )
+        existing = set(
+            model.objects.filter(
+                user=user, **{f'{target_field}_id__in': found}
+            ).values_list(f'{target_field}_id', flat=True)
+        )
+        outcomes = {}
+        for target_id in ids:
+            if target_id not in found:
+                outcomes[target_id] = NOT_FOUND
+            elif target_id in exclude:
+                outcomes[target_id] = SELF_SUBSCRIPTION
+            elif target_id in existing:
+                outcomes[target_id] = ALREADY_ADDED
+            else:
+                outcomes[target_id] = ADDED
+        added = changed_ids(outcomes, ADDED)
+        if added:
+            model.objects.bulk_create(
+                [
+                    model(user=user, **{f'{target_field}_id': target_id})
+                    for target_id in added
+                ],
+                ignore_conflicts=True,
+            )
+            after_relations_changed(model, user, added, 1)
+    return outcomes
+
+
+def remove_relations(model, user, target_field, ids):
+    """Удаляет связи пользователя с объектами ids одним DELETE.
+
+    Возвращает словарь id -> результат операции.
+    """
+    ids = unique_ids(ids)
+    with transaction.atomic():
+        lock_users(model, user, ids)
+        relations = model.objects.filter(
+            user=user, **{f'{target_field}_id__in': ids}
+        )
+        existing = set(
+            relations.values_list(f'{target_field}_id', flat=True)
+        )
+        removed = [target_id for target_id in ids if target_id in existing]
+        if removed:
+            after_relations_changed(model, user, removed, -1)
+            with muted_signals():
+                relations.delete()
+    return {
+        target_id: REMOVED if target_id in existing else NOT_ADDED
+        for target_id in ids
+    }
+
+
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину пользователя."""
+    return add_relations(model, user, 'recipe', Recipe, recipe_ids)
+
+
+def remove_recipes(model, user, recipe_ids):
+    """Удаляет рецепты из избранного или корзины пользователя."""
+    return remove_relations(model, user, 'recipe', recipe_ids)
+
+
+@transaction.atomic
+def subscribe(user, author_ids):
+    """Подписывает пользователя на авторов author_ids и добавляет
+    их последние рецепты в ленту.
+    """
+    outcomes = add_relations(
+        Subscription, user, 'author', User, author_ids, exclude=(user.pk,)
+    )
+    added = changed_ids(outcomes, ADDED)
+    TimelineEntry.objects.update_fanout(added)
+    TimelineEntry.objects.backfill(user.pk, added)
+    return outcomes
+
+
+@transaction.atomic
+def unsubscribe(user, author_ids):
+    """Отписывает пользователя от авторов author_ids и убирает
+    их рецепты из ленты.
+    """
+    outcomes = remove_relations(Subscription, user, 'author', author_ids)
+    removed = changed_ids(outcomes, REMOVED)
+    TimelineEntry.objects.remove_authors(user.pk, removed)
+    TimelineEntry.objects.update_fanout(removed)
+    return outcomes
+
+
+def decrement_counters(model, rows, exclude=()):
+    """Вычитает удаляемые строки rows модели model из счетчиков
+    COUNTERS[model] одним UPDATE на каждую различную величину.
+
+    Объекты exclude пропускаются: они удаляются вместе со строками.
+    """
+    target_model, field, counter = COUNTERS[model]
+    groups = {}
+    for target_id, count in rows.order_by().values_list(field).annotate(
+        count=Count('pk')
+    ):
+        if target_id not in exclude:
+            groups.setdefault(count, []).append(target_id)
+    for count, target_ids in groups.items():
+        change_counter(target_model, target_ids, counter, -count)
+
+
+def merge_deleted(*results):
+    """Складывает результаты нескольких QuerySet.delete()."""
+    counts = Counter()
+    for _, result in results:
+        counts.update(result)
+    return sum(counts.values()), dict(counts)
+
+
+@transaction.atomic
+def delete_recipes(recipe_ids):
+    """Удаляет рецепты recipe_ids со всеми связями.
+
+    Счетчики, списки покупок и версии обновляются пакетно, а обработчики
+    сигналов на время каскадного удаления отключаются, поэтому запросов
+    на каждую строку избранного и корзин нет. Collector Django при этом
+    все равно читает связанные строки в память и удаляет их по pk:
+    к Favorite, ShoppingCart и другим связанным моделям подключены
+    обработчики, и быстрое удаление для них недоступно. На SQLite такие
+    DELETE к тому же делятся на пачки по лимиту параметров запроса.
+    """
+    recipes = Recipe.objects.filter(pk__in=list(recipe_ids))
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    if not recipe_ids:
+        return 0, {}
+    decrement_counters(Recipe, recipes)
+    ShoppingListItem.objects.remove_recipes(recipe_ids)
+    user_ids = Favorite.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True).union(
+        ShoppingCart.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('user_id', flat=True)
+    )
+    ModelVersion.bump(
+        Recipe._meta.label_lower,
+        RecipeIngredient._meta.label_lower,
+        *(user_state_label(user_id) for user_id in user_ids),
+    )
+    with muted_signals():
+        return Recipe.objects.filter(pk__in=recipe_ids).delete()
+
+
+@transaction.atomic
+def delete_users(user_ids):
+    """Удаляет пользователей user_ids вместе с их рецептами и связями.
+
+    Как и delete_recipes, обновляет счетчики и версии пакетно
+    до каскадного удаления с отключенными обработчиками сигналов.
+    """
+    users = User.objects.filter(pk__in=list(user_ids))
+    user_ids = set(users.values_list('pk', flat=True))
+    if not user_ids:
+        return 0, {}
+    recipes = delete_recipes(
+        Recipe.objects.filter(author_id__in=user_ids).values_list(
+            'pk', flat=True
+        )
+    )
+    for model in USER_STATE_MODELS:
+        target_model = COUNTERS[model][0]
+        decrement_counters(
+            model, model.objects.filter(user_id__in=user_ids),
+            exclude=user_ids if target_model is User else (),
+        )
+    followers = Subscription.objects.filter(
+        author_id__in=user_ids
+    ).exclude(user_id__in=user_ids).values_list('user_id', flat=True)
+    ModelVersion.bump(
+        *(user_state_label(user_id) for user_id in followers)
+    )
+    authors = set(
+        Subscription.objects.filter(user_id__in=user_ids).exclude(
+            author_id__in=user_ids
+        ).values_list('author_id', flat=True)
+    )
+    with muted_signals():
+        deleted = User.objects.filter(pk__in=user_ids).delete()
+    TimelineEntry.objects.update_fanout(authors)
+    return merge_deleted(recipes, deleted)
@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from threading import local
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .counters import change_counter
+from .images import schedule_variants
+from .models import (USER_PROFILE_LABEL, Favorite, Ingredient, ModelVersion,
+                     Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem,
+                     Tag, TimelineEntry, user_state_label)
+from users.models import Subscription, User
+
+VERSIONED_MODELS = (
+    Tag,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+)
+
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'in_carts_count'),
+    Subscription: (User, 'author_id', 'followers_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+}
+
+PROFILE_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+USER_STATE_MODELS = (Favorite, ShoppingCart, Subscription)
+
+signals_state = local()
+
+
+@contextmanager
+def muted_signals():
+    """Отключает обработчики этого модуля в текущем потоке.
+
+    Используется пакетными операциями, которые сами обновляют
+    версии моделей и списки покупок одним запросом.
+    """
+    muted = is_muted()
+    signals_state.muted = True
+    try:
+        yield
+    finally:
+        signals_state.muted = muted
+
+
+def is_muted():
+    return getattr(signals_state, 'muted', False)
+
+
+def bump_model_version(sender, **kwargs):
+    """Увеличивает версию модели при сохранении или удалении объекта."""
+    if not is_muted():
+        ModelVersion.bump(sender._meta.label_lower)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model)
+    post_delete.connect(bump_model_version, sender=model)
+
+
+@receiver(pre_save, sender=User)
+def bump_user_profile_version(instance, update_fields=None, **kwargs):
+    """Увеличивает версию профилей, если меняются поля пользователя,
+    которые видны в рецептах автора.
+
+    Сохранение last_login при входе и создание пользователя
+    версию не меняют.
+    """
+    if is_muted() or instance.pk is None:
+        return
+    fields = [
+        field for field in PROFILE_FIELDS
+        if update_fields is None or field in update_fields
+    ]
+    if not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(*fields).first()
+    if old is not None and old != tuple(
+        getattr(instance, field) for field in fields
+    ):
+        ModelVersion.bump(USER_PROFILE_LABEL)
+
+
+def bump_user_state_version(sender, instance, **kwargs):
+    """Увеличивает версию состояния пользователя, чья связь изменилась."""
+    if not is_muted() and kwargs.get('created', True):
+        ModelVersion.bump(user_state_label(instance.user_id))
+
+
+for model in USER_STATE_MODELS:
+    post_save.connect(bump_user_state_version, sender=model)
+    post_delete.connect(bump_user_state_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(action, **kwargs):
+    """Увеличивает версию рецептов при изменении их тегов."""
+    if action.startswith('post_'):
+        ModelVersion.bump(Recipe._meta.label_lower)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в список покупок."""
+    if created and not is_muted():
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, (instance.recipe_id,)
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(instance, **kwargs):
+    """Вычитает ингредиенты рецепта из списка покупок.
+
+    Срабатывает до удаления, чтобы при каскадном удалении рецепта
+    его ингредиенты еще были в базе.
+    """
+    if not is_muted():
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, (instance.recipe_id,), sign=-1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_timelines(instance, created, **kwargs):
+    """Рассылает новый рецепт по лентам подписчиков автора."""
+    if created and not is_muted():
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_recipe_image_variants(instance, **kwargs):
+    """Ставит создание вариантов изображения рецепта в фоновый пул
+    после фиксации транзакции.
+
+    Срабатывает при любом сохранении рецепта, в том числе из админки,
+    пока варианты текущего изображения не отмечены готовыми; уже
+    существующие варианты не пересоздаются.
+    """
+    name = instance.image.name
+    if name and not instance.variants_ready and not is_muted():
+        transaction.on_commit(lambda: schedule_variants(name))
+
+
+def increment_counter(sender, instance, created, **kwargs):
+    """Увеличивает денормализованный счетчик при создании связи."""
+    if created and not is_muted():
+        model, field, counter = COUNTERS[sender]
+        change_counter(model, (getattr(instance, field),), counter, 1)
+
+
+def decrement_counter(sender, instance, **kwargs):
+    """Уменьшает денормализованный счетчик при удалении связи."""
+    if not is_muted():
+        model, field, counter = COUNTERS[sender]
+        change_counter(model, (getattr(instance, field),), counter, -1)
+
+
+for model in COUNTERS:
+    post_save.connect(increment_counter, sender=model)
+    post_delete.connect(decrement_counter, sender=model)
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline(instance, created, **kwargs):
+    """Добавляет в ленту последние рецепты автора после подписки.
+
+    Подключен после счетчиков, чтобы update_fanout видел новое
+    число подписчиков автора.
+    """
+    if created and not is_muted():
+        TimelineEntry.objects.update_fanout((instance.author_id,))
+        TimelineEntry.objects.backfill(
+            instance.user_id, (instance.author_id,)
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_timeline(instance, **kwargs):
+    """Убирает рецепты автора из ленты после отписки."""
+    if not is_muted():
+        TimelineEntry.objects.remove_authors(
+            instance.user_id, (instance.author_id,)
+        )
+        TimelineEntry.objects.update_fanout((instance.author_id,))
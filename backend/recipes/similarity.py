@@ -0,0 +1,112 @@
+import numpy as np
+
+from .models import Recipe, RecipeIngredient
+
+TOP_K: int = 10
+TAG_WEIGHT: float = 0.5
+
+
+class RecipeMatrix:
+    """Разреженная матрица рецепт x признак для поиска похожих.
+
+    Признаки - ингредиенты (с весом IDF) и теги (с весом TAG_WEIGHT).
+    Строки нормированы, поэтому скалярное произведение строк равно
+    косинусной близости. Матрица хранится в виде списков
+    столбцов: для каждого признака - номера строк и веса.
+    """
+
+    def __init__(self, recipe_ids, rows, columns, is_tag):
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        self.positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(recipe_ids)
+        }
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        weights = self.get_weights(columns, np.asarray(is_tag, dtype=bool))
+        norms = np.sqrt(
+            np.bincount(rows, weights ** 2, minlength=len(recipe_ids))
+        )
+        weights /= norms[rows]
+        order = np.lexsort((rows, columns))
+        self.rows, self.columns = rows[order], columns[order]
+        self.weights = weights[order]
+        self.column_bounds = np.searchsorted(
+            self.columns, np.arange(self.columns.max(initial=-1) + 2)
+        )
+        row_order = np.argsort(rows, kind='stable')
+        self.row_columns = columns[row_order]
+        self.row_weights = weights[row_order]
+        self.row_bounds = np.searchsorted(
+            rows[row_order], np.arange(len(recipe_ids) + 1)
+        )
+
+    @classmethod
+    def build(cls):
+        """Строит матрицу из RecipeIngredient и тегов рецептов."""
+        recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(recipe_ids)
+        }
+        features = {}
+        rows, columns, is_tag = [], [], []
+        pairs = (
+            (False, RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            )),
+            (True, Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag_id'
+            )),
+        )
+        for tag, values in pairs:
+            for recipe_id, feature_id in values.order_by().iterator():
+                if recipe_id not in positions:
+                    continue
+                rows.append(positions[recipe_id])
+                columns.append(
+                    features.setdefault((tag, feature_id), len(features))
+                )
+                is_tag.append(tag)
+        return cls(recipe_ids, rows, columns, is_tag)
+
+    def get_weights(self, columns, is_tag):
+        """IDF для ингредиентов, постоянный вес для тегов."""
+        frequency = np.bincount(columns)
+        idf = np.log((1 + len(self.recipe_ids)) / (1 + frequency)) + 1
+        weights = idf[columns]
+        weights[is_tag] = TAG_WEIGHT
+        return weights
+
+    def scores(self, position):
+        """Косинусная близость рецепта position со всеми рецептами."""
+        start, end = self.row_bounds[position], self.row_bounds[position + 1]
+        slices = [
+            (self.column_bounds[column], self.column_bounds[column + 1])
+            for column in self.row_columns[start:end]
+        ]
+        if not slices:
+            return np.zeros(len(self.recipe_ids))
+        rows = np.concatenate([self.rows[a:b] for a, b in slices])
+        weights = np.concatenate([
+            self.weights[a:b] * weight
+            for (a, b), weight in zip(slices, self.row_weights[start:end])
+        ])
+        return np.bincount(rows, weights, minlength=len(self.recipe_ids))
+
+    def neighbors(self, recipe_id, k=TOP_K):
+        """Список (id, близость) k ближайших рецептов, лучшие первыми."""
+        position = self.positions[recipe_id]
+        scores = self.scores(position)
+        scores[position] = 0
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((self.recipe_ids[top], -scores[top]))]
+        return [
+            (int(self.recipe_ids[index]), float(scores[index]))
+            for index in top if scores[index] > 0
+        ]
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Subscription, User
+from recipes.services import delete_users
 
 
 @admin.register(User)
@@ -13,6 +14,8 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'is_superuser',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = (
         'username',
@@ -22,6 +25,9 @@ class UserAdmin(admin.ModelAdmin):
     )
     list_filter = ('is_superuser',)
 
+    def delete_queryset(self, request, queryset):
+        delete_users(queryset.values_list('pk', flat=True))
+
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
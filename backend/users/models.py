@@ -20,6 +20,15 @@ class User(AbstractUser):
         unique=True,
         validators=(username_validator,),
     )
+    recipes_count = models.PositiveIntegerField(
+        'количество рецептов', default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'количество подписчиков', default=0, editable=False
+    )
+    feed_fanout = models.BooleanField(
+        'рассылка рецептов по лентам', default=True, editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name',)
@@ -27,6 +36,13 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return self.username
 
+    def delete(self, using=None, keep_parents=False):
+        """Удаляет пользователя пакетно, см.
+        recipes.services.delete_users.
+        """
+        from recipes.services import delete_users
+        return delete_users((self.pk,))
+
     class Meta:
         ordering = ('id',)
         verbose_name = 'Пользователь'